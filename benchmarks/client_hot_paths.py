@@ -0,0 +1,493 @@
+"""
+Microbenchmarks for the client-side helpers the load generator runs on every request
+
+Measures operations per second and the peak memory allocated by a single operation, and compares
+them with a stored baseline so a change that makes the generator saturate sooner gets caught:
+
+    python -m benchmarks.client_hot_paths                  # compare with benchmarks/baseline.json
+    python -m benchmarks.client_hot_paths --save-baseline  # record a new baseline
+    python -m benchmarks.client_hot_paths --filter es.     # only run matching benchmarks
+
+Benchmarks whose dependencies are not installed are reported as skipped, any other import error
+fails. Numbers are machine specific, so record the baseline on the machine the comparison runs on.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+# minimum wall time spent measuring each benchmark
+MIN_SECONDS = 0.5
+# number of single operations traced to find the peak allocation
+TRACED_RUNS = 5
+
+BENCHMARKS = {}
+
+# channel settings which must be present to import the channels modules
+os.environ.setdefault("OPEN_DISCUSSIONS_REDDIT_CLIENT_ID", "bench")
+os.environ.setdefault("OPEN_DISCUSSIONS_REDDIT_SECRET", "bench")
+os.environ.setdefault("OPEN_DISCUSSIONS_REDDIT_ACCESS_TOKEN", "bench")
+os.environ.setdefault("OPEN_DISCUSSIONS_REDDIT_URL", "http://reddit.bench.local")
+
+
+def benchmark(name):
+    """
+    Register a benchmark
+
+    The decorated function does any setup and returns the operation to measure, a callable
+    taking no arguments. It may raise ModuleNotFoundError if a dependency is missing.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def _search_params():
+    """Search parameters from the smallest to the largest facet selection"""
+    from open_discussions.util.es import OfferedByType, PriceType, QueryParams, ResourceType
+
+    return {
+        "small": QueryParams("Albedo", [ResourceType.VIDEO], [], []),
+        "medium": QueryParams(
+            "\"Machine Learning\"",
+            [ResourceType.COURSE, ResourceType.PROGRAM, ResourceType.VIDEO],
+            [OfferedByType.MITX, OfferedByType.OCW],
+            [],
+        ),
+        "large": QueryParams("Kinetic", list(ResourceType), list(OfferedByType), [PriceType.PAID]),
+    }
+
+
+def _register_search_benchmarks():
+    """Register the es and naming benchmarks for each facet size"""
+    for size in ("small", "medium", "large"):
+        def generate(size=size):
+            from open_discussions.util.es import generate_learn_query
+            params = _search_params()[size]
+            return lambda: generate_learn_query(params, 12, 6)
+
+        def encode(size=size):
+            from open_discussions.util.es import encode_learn_query
+            params = _search_params()[size]
+            return lambda: encode_learn_query(params, 12, 6)
+
+        def cached(size=size):
+            from open_discussions.util.es import QueryCache
+            params = _search_params()[size]
+            cache = QueryCache(16)
+            return lambda: cache.get(params, 12, 6)
+
+        def name(size=size):
+            from open_discussions.learn.naming import request_name, search_dimensions
+            params = _search_params()[size]
+            return lambda: (request_name("/api/v0/search/", params, 2), search_dimensions(params, 2))
+
+        def legacy_name(size=size):
+            params = _search_params()[size]
+            page = 2
+            # the unbounded per-facet names SearchPage used before request_name()
+            return lambda: (
+                f"/api/v0/search/"
+                f"?q={params.text}"
+                f"&type={','.join([rt.value for rt in params.types])}"
+                f"&o={','.join([o.value for o in params.offered_by])}"
+                f"&p={page}"
+            )
+
+        benchmark("es.generate_learn_query[{}]".format(size))(generate)
+        benchmark("es.encode_learn_query[{}]".format(size))(encode)
+        benchmark("es.QueryCache.get[{}]".format(size))(cached)
+        benchmark("naming.request_name[{}]".format(size))(name)
+        benchmark("naming.legacy_fstring[{}]".format(size))(legacy_name)
+
+
+_register_search_benchmarks()
+
+
+@benchmark("routes.route_name")
+def route_naming():
+    """Naming a praw request from its url"""
+    from open_discussions.channels.routes import route_name
+    urls = [
+        "http://reddit.bench.local/r/channel_0123456789/hot?limit=25&raw_json=1",
+        "http://reddit.bench.local/comments/4f2a/?limit=2048&sort=best&raw_json=1",
+        "http://reddit.bench.local/api/vote/?raw_json=1",
+        "http://reddit.bench.local/r/channel_0123456789/api/friend/?raw_json=1",
+    ]
+    return lambda: [route_name(url) for url in urls]
+
+
+@benchmark("faker.paragraph")
+def fake_paragraph():
+    """The post and comment payloads generated by the channels tests"""
+    from faker import Faker
+    fake = Faker()
+    return lambda: (" ".join(fake.paragraph().split(" ")[:2]), fake.paragraph())
+
+
+def _null_session(responses=None):
+    """
+    Args:
+        responses (dict): canned response bodies by the last segment of the url path
+
+    Returns:
+        HttpSession: a locust session whose requests are answered locally without any I/O
+    """
+    from locust.clients import HttpSession
+    from requests.adapters import BaseAdapter
+    from requests.models import Response
+
+    responses = responses or {}
+
+    class NullAdapter(BaseAdapter):
+        """Answers every request with its canned response, or an empty JSON object"""
+        def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+            response = Response()
+            response.status_code = 200
+            response.headers["Content-Type"] = "application/json"
+            segment = request.path_url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+            response._content = responses.get(segment, b"{}")  # pylint: disable=protected-access
+            response.request = request
+            response.url = request.url
+            return response
+
+        def close(self):
+            pass
+
+    session = HttpSession("http://bench.local")
+    session.mount("http://", NullAdapter())
+    return session
+
+
+def _reddit_responses():
+    """
+    Returns:
+        dict: canned reddit responses for the access token, a hot listing and a post with its comments
+    """
+    def post(index):
+        return {
+            "kind": "t3",
+            "data": {
+                "id": "p{}".format(index), "name": "t3_p{}".format(index), "title": "Bench post {}".format(index),
+                "selftext": "lorem ipsum " * 20, "author": "bench", "subreddit": "bench_channel",
+                "subreddit_id": "t5_1", "created_utc": 1500000000.0, "score": index, "ups": index,
+                "downs": 0, "likes": None, "num_comments": 3, "is_self": True, "permalink": "/r/bench/p",
+                "url": "http://reddit.bench.local/r/bench/p", "edited": False, "stickied": False,
+                "archived": False, "locked": False, "over_18": False, "thumbnail": "self",
+            },
+        }
+
+    def comment(index):
+        return {
+            "kind": "t1",
+            "data": {
+                "id": "c{}".format(index), "name": "t1_c{}".format(index), "body": "lorem ipsum " * 10,
+                "author": "bench", "parent_id": "t3_p0", "link_id": "t3_p0", "subreddit": "bench_channel",
+                "created_utc": 1500000000.0, "score": 1, "ups": 1, "downs": 0, "likes": None,
+                "edited": False, "replies": "", "depth": 0,
+            },
+        }
+
+    def listing(children):
+        return {"kind": "Listing", "data": {"children": children, "after": None, "before": None}}
+
+    return {
+        "access_token": json.dumps({
+            "access_token": "bench", "expires_in": 3600, "scope": "*", "token_type": "bearer",
+        }).encode(),
+        "hot": json.dumps(listing([post(index) for index in range(25)])).encode(),
+        "p0": json.dumps([listing([post(0)]), listing([comment(index) for index in range(3)])]).encode(),
+    }
+
+
+def _reddit_api(backend):
+    """
+    Args:
+        backend (str): praw or raw
+
+    Returns:
+        Api or RawApi: a channel api answered by canned reddit responses
+    """
+    session = _null_session(_reddit_responses())
+    if backend == "raw":
+        # only needs requests, so it runs without praw installed
+        from open_discussions.channels.raw_api import RawApi, RawClient, User
+
+        client = RawClient(session, os.environ["OPEN_DISCUSSIONS_REDDIT_URL"], "bench", "bench", "bench", "bench")
+        return RawApi(User("bench"), lambda user: client)
+
+    from open_discussions.channels import channel_api
+
+    channel_api.LOCUST_SESSION = session
+    channel_api.get_or_create_user = lambda username: "bench-refresh-token"
+    # a client pooled by another benchmark would still be bound to that benchmark's session
+    channel_api.CLIENT_POOL.clear()
+    return channel_api.Api(channel_api.FakeUser("bench-reddit"))
+
+
+def _register_backend_benchmarks():
+    """Register the same reddit tasks for the praw and raw backends of channel_api"""
+    for backend in ("praw", "raw"):
+        def front_page(backend=backend):
+            api = _reddit_api(backend)
+            return api.front_page
+
+        def upvote_post(backend=backend):
+            api = _reddit_api(backend)
+
+            def operation():
+                # the requests of loadtest_reddit's upvote_post task
+                if api.get_post_likes("p0") is not True:
+                    api.vote_post("p0", 1)
+                api.load_post("p0")
+            return operation
+
+        benchmark("reddit.front_page[{}]".format(backend))(front_page)
+        benchmark("reddit.upvote_post[{}]".format(backend))(upvote_post)
+
+
+_register_backend_benchmarks()
+
+
+@benchmark("reddit.get_post_likes[praw,pass-through]")
+def pass_through_request():
+    """A praw request with OPEN_DISCUSSIONS_REDDIT_CLIENT_THROTTLING=false, failing if prawcore sleeps"""
+    import prawcore.sessions
+    from open_discussions.channels import channel_api, throttle
+
+    class NoSleep:
+        """The time module, except that sleeping fails"""
+        def __getattr__(self, name):
+            return getattr(time, name)
+
+        @staticmethod
+        def sleep(seconds):
+            raise AssertionError("a pass-through request slept for {:.1f}s".format(seconds))
+
+    channel_api.LOCUST_SESSION = _null_session(_reddit_responses())
+    channel_api.get_or_create_user = lambda username: "bench-refresh-token"
+    # a user of its own, the pooled clients of the other benchmarks keep praw's throttling
+    api = channel_api.Api(channel_api.FakeUser("bench-pass-through"))
+    throttle.pass_through(api.reddit._core)  # pylint: disable=protected-access
+    prawcore.sessions.time = NoSleep()
+    return lambda: api.get_post_likes("p0")
+
+
+@benchmark("comments.add[deep]")
+def flatten_deep_thread():
+    """Flattening the comments of a post with a 500 comment deep thread and 500 top-level comments"""
+    from open_discussions.channels import comments
+
+    def comment(name, parent, replies=()):
+        children = {"data": {"children": list(replies)}} if replies else ""
+        return {"kind": "t1", "data": {"name": name, "parent_id": parent, "replies": children}}
+
+    thread = comment("t1_d499", "t1_d498")
+    for index in range(498, -1, -1):
+        thread = comment("t1_d{}".format(index), "t1_d{}".format(index - 1) if index else "t3_p", [thread])
+    nodes = [thread] + [comment("t1_c{}".format(index), "t3_p") for index in range(500)]
+
+    def operation():
+        comments.add(comments.new_tree("t3_p"), nodes, comments.describe_thing)
+    return operation
+
+
+@benchmark("registry.pick")
+def registry_pick():
+    """Picking a contributor and a post, as every channel task does, from full registry kinds"""
+    from open_discussions.util.registry import EntityRegistry
+
+    registry = EntityRegistry(10000)
+    for index in range(10000):
+        registry.add(("contributors", "channel"), "user{}".format(index))
+        registry.add(("posts", "channel"), "p{}".format(index))
+    return lambda: (registry.pick(("contributors", "channel")), registry.pick(("posts", "channel")))
+
+
+@benchmark("registry.add_remove")
+def registry_add_remove():
+    """Adding an entity to a full registry kind and removing one"""
+    from open_discussions.util.registry import EntityRegistry
+
+    registry = EntityRegistry(10000)
+    for index in range(10000):
+        registry.add("users", "user{}".format(index))
+    counter = iter(range(10 ** 9))
+
+    def operation():
+        registry.add("users", "new{}".format(next(counter)))
+        registry.remove("users", registry.pick("users"))
+    return operation
+
+
+@benchmark("channel_api.Api")
+def api_construction():
+    """Getting an Api client, pooled unless OPEN_DISCUSSIONS_REDDIT_CLIENT_POOL_SIZE=0"""
+    from open_discussions.channels import channel_api
+
+    channel_api.LOCUST_SESSION = _null_session()
+    channel_api.get_or_create_user = lambda username: "bench-refresh-token"
+    user = channel_api.FakeUser("bench")
+    return lambda: channel_api.Api(user)
+
+
+@benchmark("channel_api._build_client")
+def client_construction():
+    """Building a praw client without the client pool"""
+    from open_discussions.channels import channel_api
+
+    channel_api.LOCUST_SESSION = _null_session()
+    channel_api.get_or_create_user = lambda username: "bench-refresh-token"
+    user = channel_api.FakeUser("bench")
+    return lambda: channel_api._build_client(user)  # pylint: disable=protected-access
+
+
+def _register_patched_benchmarks():
+    """Register a benchmark for each of the utils.patched_* request builders"""
+    calls = {
+        "patched_user_update": lambda func, api: func(api, "bench", name="Bench User"),
+        "patched_add_contributor": lambda func, api: func(api, "bench_channel", "bench"),
+        "patched_remove_contributor": lambda func, api: func(api, "bench_channel", "bench"),
+        "patched_add_moderator": lambda func, api: func(api, "bench_channel", "bench"),
+        "patched_remove_moderator": lambda func, api: func(api, "bench_channel", "bench"),
+        "patched_add_subscriber": lambda func, api: func(api, "bench_channel", "bench"),
+        "patched_remove_subscriber": lambda func, api: func(api, "bench_channel", "bench"),
+    }
+    for func_name, call in calls.items():
+        def setup(func_name=func_name, call=call):
+            from types import SimpleNamespace
+            from open_discussions.channels import utils
+
+            api = SimpleNamespace(
+                session=_null_session(),
+                get_url=lambda path: "http://bench.local/api/v0{}".format(path),
+            )
+            func = getattr(utils, func_name)
+            return lambda: call(func, api)
+
+        benchmark("utils.{}".format(func_name))(setup)
+
+
+_register_patched_benchmarks()
+
+
+def measure(operation):
+    """
+    Measure an operation
+
+    Args:
+        operation (callable): the operation
+
+    Returns:
+        dict: ops_per_sec and peak_bytes, the peak memory allocated by a single operation
+    """
+    # warm up, and find a batch size which takes a measurable amount of time
+    batch = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(batch):
+            operation()
+        elapsed = time.perf_counter() - start
+        if elapsed > 0.01:
+            break
+        batch *= 2
+
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            operation()
+        runs += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SECONDS:
+            break
+
+    peaks = []
+    for _ in range(TRACED_RUNS):
+        tracemalloc.start()
+        base, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak - base)
+
+    return {
+        "ops_per_sec": round(runs / elapsed, 1),
+        "peak_bytes": min(peaks),
+    }
+
+
+def compare(name, result, baseline, threshold):
+    """
+    Compare a result with its baseline
+
+    Returns:
+        list of str: the regressions found
+    """
+    regressions = []
+    if baseline is None:
+        return regressions
+    if result["ops_per_sec"] < baseline["ops_per_sec"] * (1 - threshold):
+        regressions.append("{}: {} ops/sec, baseline {}".format(
+            name, result["ops_per_sec"], baseline["ops_per_sec"]
+        ))
+    if result["peak_bytes"] > baseline["peak_bytes"] * (1 + threshold):
+        regressions.append("{}: peak {} bytes, baseline {}".format(
+            name, result["peak_bytes"], baseline["peak_bytes"]
+        ))
+    return regressions
+
+
+def main():
+    """Run the benchmarks"""
+    parser = argparse.ArgumentParser(description="Benchmark the load generator's client-side hot paths")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="path of the baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25,
+        help="allowed relative slowdown or allocation growth before a result counts as a regression"
+    )
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    regressions = []
+    for name, setup in sorted(BENCHMARKS.items()):
+        if args.filter not in name:
+            continue
+        try:
+            operation = setup()
+        except ModuleNotFoundError as ex:
+            # an ImportError of an installed module is a bug, not a missing dependency
+            print("{:<45} skipped ({})".format(name, ex))
+            continue
+        result = results[name] = measure(operation)
+        print("{:<45} {:>12,.0f} ops/sec {:>10,} peak bytes".format(name, result["ops_per_sec"], result["peak_bytes"]))
+        regressions.extend(compare(name, result, baseline.get(name), args.threshold))
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print("Saved baseline to {}".format(args.baseline))
+        return
+
+    if regressions:
+        print("\nRegressions beyond {:.0%}:".format(args.threshold))
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Task audit, checking each task sends the requests it claims to
+
+Tasks declare the requests they send with @expects, under @task. With
+OPEN_DISCUSSIONS_TASK_AUDIT=true every run of a declared task records the requests it actually
+sent, including those sent by greenlets it spawned, and compares them with the declaration:
+
+    runs     times the task ran to completion
+    empty    runs that sent no request at all
+    missing  runs that didn't send one of the required requests
+    extra    runs that sent a request not declared
+
+The counts are reported per task as client counters, and the first violation of each task is
+logged. Requests any task may send as a side effect, like authorizing a newly built client, are
+only counted by tasks declaring them.
+"""
+from collections import namedtuple
+import logging
+
+import gevent
+from locust import TaskSet, events
+
+from open_discussions.channels import settings
+from open_discussions.util import reporting
+
+log = logging.getLogger(__name__)
+
+HTTP_METHODS = frozenset(("GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"))
+
+Contract = namedtuple("Contract", ["required", "optional"])
+
+# request names any task may send as a side effect
+INCIDENTAL = set()
+STATS = {}
+reporting.register("task_audit", lambda: dict(STATS))
+# names of the requests sent so far, by the greenlet running an audited task
+ACTIVE = {}
+WARNED = set()
+
+
+def expects(*required, optional=()):
+    """
+    Declare the requests a task sends, by request name without any bracketed tags
+
+    Args:
+        *required (str): names sent at least once by every run
+        optional (iterable of str): names a run may also send
+    """
+    def decorator(func):
+        func.audit_contract = Contract(frozenset(required), frozenset(optional))
+        return func
+    return decorator
+
+
+def ignore(*names):
+    """
+    Args:
+        *names (str): request names any task may send as a side effect
+    """
+    INCIDENTAL.update(names)
+
+
+def _on_request(request_type, name, **kwargs):  # pylint: disable=unused-argument
+    """Record a request against the audited task of the greenlet sending it, or of its spawner"""
+    if request_type not in HTTP_METHODS:
+        return
+    greenlet = gevent.getcurrent()
+    while greenlet is not None:
+        names = ACTIVE.get(greenlet)
+        if names is not None:
+            names.append(name.split(" [", 1)[0])
+            return
+        spawning = getattr(greenlet, "spawning_greenlet", None)
+        greenlet = spawning() if spawning is not None else None
+
+
+def check(task_name, contract, names):
+    """
+    Compare the requests of a task run with its contract
+
+    Args:
+        task_name (str): the task, reported as TaskSet.method
+        contract (Contract): the declared requests
+        names (list of str): the names of the requests sent
+    """
+    declared = contract.required | contract.optional
+    counted = [name for name in names if name in declared or name not in INCIDENTAL]
+    missing = contract.required.difference(counted)
+    extra = sorted(set(counted).difference(declared))
+
+    STATS[task_name + ".runs"] = STATS.get(task_name + ".runs", 0) + 1
+    for problem, found in (("empty", not counted), ("missing", missing), ("extra", extra)):
+        key = "{}.{}".format(task_name, problem)
+        STATS.setdefault(key, 0)
+        if found:
+            STATS[key] += 1
+
+    if (missing or extra) and task_name not in WARNED:
+        WARNED.add(task_name)
+        log.warning(
+            "%s sent %s: missing %s, not declared %s",
+            task_name, counted or "no requests", sorted(missing) or "none", extra or "none",
+        )
+
+
+class AuditedTaskSet(TaskSet):
+    """A TaskSet whose declared tasks are audited when OPEN_DISCUSSIONS_TASK_AUDIT is on"""
+    def execute_task(self, task, *args, **kwargs):
+        contract = getattr(task, "audit_contract", None)
+        if not settings.OPEN_DISCUSSIONS_TASK_AUDIT or contract is None:
+            return super().execute_task(task, *args, **kwargs)
+
+        greenlet = gevent.getcurrent()
+        names = ACTIVE[greenlet] = []
+        try:
+            super().execute_task(task, *args, **kwargs)
+        finally:
+            del ACTIVE[greenlet]
+        check("{}.{}".format(type(self).__name__, task.__name__), contract, names)
+        return None
+
+
+if settings.OPEN_DISCUSSIONS_TASK_AUDIT:
+    events.request_success += _on_request
+    events.request_failure += _on_request
@@ -1,19 +1,26 @@
 """Channels APIs copied from open-discussions/channels/api.py, edited to fit"""
 # pylint: disable=too-many-public-methods
-from threading import local
+from collections import deque
+import random
 from urllib.parse import urljoin
 
-from contextlib import contextmanager
+import gevent
 import requests
 import praw
 from praw.models.reddit import more
 from praw.models.reddit.redditor import Redditor
+from locust import events
 from prawcore.exceptions import (
     Forbidden as PrawForbidden,
     NotFound as PrawNotFound,
 )
 
-import .settings
+from open_discussions.channels import comments, settings, throttle
+from open_discussions.channels.raw_api import RawApi, RawClient
+from open_discussions.channels.routes import route_name
+from open_discussions.channels.vault import ACCESS_TOKEN_HEADER_NAME, REFRESH_TOKEN_PATH, CredentialVault
+from open_discussions.util import reporting
+from open_discussions.util.cache import LRUCache
 
 CHANNEL_TYPE_PUBLIC = 'public'
 CHANNEL_TYPE_PRIVATE = 'private'
@@ -24,7 +31,12 @@ VALID_CHANNEL_TYPES = (
 )
 
 USER_AGENT = 'MIT-Open: {version}'
-ACCESS_TOKEN_HEADER_NAME = 'X-Access-Token'
+
+BACKEND_PRAW = 'praw'
+BACKEND_RAW = 'raw'
+BACKENDS = (BACKEND_PRAW, BACKEND_RAW)
+if settings.OPEN_DISCUSSIONS_REDDIT_BACKEND not in BACKENDS:
+    raise Exception("OPEN_DISCUSSIONS_REDDIT_BACKEND must be one of {}".format(", ".join(BACKENDS)))
 
 CHANNEL_SETTINGS = (
     'header_title',
@@ -41,37 +53,89 @@ class FakeUser:
         self.username = username
 
 
+# refresh tokens by username, so building a client doesn't request a new token every time
+TOKEN_CACHE = LRUCache(
+    settings.OPEN_DISCUSSIONS_REDDIT_TOKEN_CACHE_SIZE,
+    ttl=settings.OPEN_DISCUSSIONS_REDDIT_TOKEN_CACHE_TTL,
+)
+reporting.register("reddit_refresh_tokens", TOKEN_CACHE.stats)
+
+# refresh tokens shared by the processes on this host, see open_discussions.channels.vault
+VAULT = CredentialVault(settings.OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT) \
+    if settings.OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT else None
+# a connection of its own for writes, so reads on the loop don't wait for a write in the thread
+VAULT_WRITER = CredentialVault(settings.OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT) \
+    if VAULT is not None else None
+# refresh tokens requested during the run, waiting to be written to the vault
+VAULT_PENDING = []
+# provisioned usernames not handed out yet, shuffled once on first use
+PROVISIONED_USERNAMES = None
+
+
+def _take_pending_tokens():
+    """
+    Returns:
+        list of tuple of (str, str): the pending (username, refresh token) pairs, no longer pending
+    """
+    batch = VAULT_PENDING[:]
+    del VAULT_PENDING[:]
+    return batch
+
+
+def _flush_vault():
+    """
+    Write the pending refresh tokens every few seconds, from a native thread
+
+    The write may wait up to the vault's timeout for another process to release its lock, which
+    would freeze every simulated user if it ran on the gevent loop.
+    """
+    if VAULT_WRITER is None:
+        return
+    while True:
+        gevent.sleep(settings.OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT_FLUSH_SECONDS)
+        batch = _take_pending_tokens()
+        if batch:
+            gevent.get_hub().threadpool.apply(VAULT_WRITER.put_many, (batch,))
+
+
+if VAULT_WRITER is not None:
+    reporting.register(
+        "reddit_credential_vault",
+        lambda: dict(VAULT.stats(), writes=VAULT_WRITER.writes, pending=len(VAULT_PENDING)),
+    )
+    gevent.spawn(_flush_vault)
+    # whatever is left once the run is over
+    events.quitting += lambda: VAULT_WRITER.put_many(_take_pending_tokens())
+
+# reddit clients by username, a pooled client keeps the access token it was authorized with
+CLIENT_POOL = LRUCache(
+    settings.OPEN_DISCUSSIONS_REDDIT_CLIENT_POOL_SIZE,
+    ttl=settings.OPEN_DISCUSSIONS_REDDIT_CLIENT_POOL_IDLE_SECONDS,
+    sliding=True,
+)
+CLIENT_STATS = {"constructions": 0}
+reporting.register("reddit_clients", lambda: dict(CLIENT_POOL.stats(), **CLIENT_STATS))
+
 # replace this with the given session
-COUNTER = 0
-LOCAL = local()
 LOCUST_SESSION = None
 
 
 def patch_locust_request():
+    """
+    Patch the locust session so requests made without a name, such as every request praw makes,
+    are named after the route of their url, and any throttling reddit signals is recorded
+    """
     old_request = LOCUST_SESSION.request
 
     def altered_request(method, url, name=None, **kwargs):
-        global LOCAL
-        method = method.upper()
-
-        try:
-            print("Set name to {}".format(name))
-            name = LOCAL.patched_name
-        except AttributeError:
-            print("No name, using {}".format(name))
-            pass
-        return old_request(method, url, name=name, **kwargs)
+        name = name or route_name(url, kwargs.get('params'))
+        response = old_request(method.upper(), url, name=name, **kwargs)
+        throttle.record(name, response)
+        return response
 
     LOCUST_SESSION.request = altered_request
 
 
-@contextmanager
-def request_name(name):
-    LOCAL.patched_name = name
-    yield
-    LOCAL.patched_name = None
-
-
 def get_or_create_user(username):
     """
     Get or create a user on reddit using our refresh_token plugin
@@ -86,14 +150,65 @@ def get_or_create_user(username):
     # a modified instance of reddit. It registers a new user with a random password if
     # one does not exist, then obtains an OAuth refresh token for that user. This is then used
     # with praw to authenticate.
-    refresh_token_url = urljoin(settings.OPEN_DISCUSSIONS_REDDIT_URL, '/api/v1/generate_refresh_token')
+    refresh_token_url = urljoin(settings.OPEN_DISCUSSIONS_REDDIT_URL, REFRESH_TOKEN_PATH)
 
     session = _get_session()
-    with request_name("/api/v1/generate_refresh_token"):
-        resp = session.get(refresh_token_url, params={'username': username}, name='/api/v1/generate_refresh_token').json()
+    resp = session.get(refresh_token_url, params={'username': username}, name=REFRESH_TOKEN_PATH).json()
+    TOKEN_CACHE.put(username, resp['refresh_token'])
+    if VAULT is not None:
+        VAULT_PENDING.append((username, resp['refresh_token']))
     return resp['refresh_token']
 
 
+def _stored_or_new_token(username):
+    """
+    Returns:
+        str: the refresh token for a user from the vault, or a newly requested one
+    """
+    if VAULT is not None:
+        refresh_token = VAULT.get(username)
+        if refresh_token is not None:
+            return refresh_token
+    return get_or_create_user(username)
+
+
+def provisioned_username():
+    """
+    Pick a user provisioned into the vault ahead of the run, each is handed out once per process
+
+    Returns:
+        str: a provisioned username not handed out yet, or None if there is none left
+    """
+    global PROVISIONED_USERNAMES  # pylint: disable=global-statement
+    if VAULT is None:
+        return None
+    if PROVISIONED_USERNAMES is None:
+        usernames = list(VAULT.usernames())
+        random.shuffle(usernames)
+        PROVISIONED_USERNAMES = deque(usernames)
+    if not PROVISIONED_USERNAMES:
+        return None
+    return PROVISIONED_USERNAMES.popleft()
+
+
+def get_refresh_token(username):
+    """
+    Get a refresh token for a user from the token cache or the vault, requesting a new one if neither has it
+
+    If OPEN_DISCUSSIONS_REDDIT_TOKEN_PER_CLIENT is set a new token is always requested,
+    like every client used to do.
+
+    Args:
+        username (str): The reddit username
+
+    Returns:
+        str: A refresh token for use with praw to authenticate
+    """
+    if settings.OPEN_DISCUSSIONS_REDDIT_TOKEN_PER_CLIENT:
+        return get_or_create_user(username)
+    return TOKEN_CACHE.get_or_create(username, lambda: _stored_or_new_token(username))
+
+
 def _get_user_credentials(user):
     """
     Get credentials for authenticated user
@@ -104,7 +219,7 @@ def _get_user_credentials(user):
     Returns:
         dict: set of configuration credentials for the user
     """
-    refresh_token = get_or_create_user(user.username)
+    refresh_token = get_refresh_token(user.username)
 
     return {
         'client_id': settings.OPEN_DISCUSSIONS_REDDIT_CLIENT_ID,
@@ -144,17 +259,39 @@ def _get_requester_kwargs():
 
 def _get_client(user):
     """
-    Get a configured Reddit client_id
+    Get a configured Reddit client from the client pool, building one on a miss
 
     Args:
         user (User): the authenticated user
 
     Returns:
-        praw.Reddit: configured reddit client
+        praw.Reddit or RawClient: configured reddit client for the selected backend
+    """
+    return CLIENT_POOL.get_or_create(user.username, lambda: _build_client(user))
+
+
+def _build_client(user):
     """
+    Build a configured Reddit client
+
+    Args:
+        user (User): the authenticated user
+
+    Returns:
+        praw.Reddit or RawClient: configured reddit client for the selected backend
+    """
+    CLIENT_STATS["constructions"] += 1
     credentials = _get_user_credentials(user=user)
 
-    return praw.Reddit(
+    if settings.OPEN_DISCUSSIONS_REDDIT_BACKEND == BACKEND_RAW:
+        return RawClient(
+            session=_get_session(),
+            reddit_url=settings.OPEN_DISCUSSIONS_REDDIT_URL,
+            user_agent=_get_user_agent(),
+            **credentials
+        )
+
+    reddit = praw.Reddit(
         reddit_url=settings.OPEN_DISCUSSIONS_REDDIT_URL,
         oauth_url=settings.OPEN_DISCUSSIONS_REDDIT_URL,
         short_url=settings.OPEN_DISCUSSIONS_REDDIT_URL,
@@ -163,6 +300,9 @@ def _get_client(user):
         check_for_updates=False,
         **credentials
     )
+    if not settings.OPEN_DISCUSSIONS_REDDIT_CLIENT_THROTTLING:
+        throttle.pass_through(reddit._core)  # pylint: disable=protected-access
+    return reddit
 
 
 def _get_user_agent():
@@ -170,6 +310,47 @@ def _get_user_agent():
     return USER_AGENT.format(version=settings.VERSION)
 
 
+def make_api(user):
+    """
+    Get a channel API for the backend selected by OPEN_DISCUSSIONS_REDDIT_BACKEND
+
+    Args:
+        user (User): the authenticated user
+
+    Returns:
+        Api or RawApi: the channel API
+    """
+    if settings.OPEN_DISCUSSIONS_REDDIT_BACKEND == BACKEND_RAW:
+        return RawApi(user, _get_client)
+    return Api(user)
+
+
+def thing_id(thing):
+    """
+    Args:
+        thing (praw.models.reddit.base.RedditBase or dict): a post or comment from either backend
+
+    Returns:
+        str: the base36 id of the post or comment
+    """
+    if isinstance(thing, dict):
+        return thing['id']
+    return thing.id
+
+
+def thing_fullname(thing):
+    """
+    Args:
+        thing (praw.models.reddit.base.RedditBase or dict): a post or comment from either backend
+
+    Returns:
+        str: the fullname of the post or comment, as listings page by it
+    """
+    if isinstance(thing, dict):
+        return thing['name']
+    return thing.fullname
+
+
 class Api:
     """Channel API"""
     def __init__(self, user):
@@ -184,7 +365,7 @@ class Api:
         Returns:
             ListingGenerator(praw.models.Subreddit): a generator over channel listings
         """
-        return self.reddit.user.subreddits()
+        return _listing(self.reddit.user.subreddits())
 
     def get_channel(self, name):
         """
@@ -195,6 +376,18 @@ class Api:
         """
         return self.reddit.subreddit(name)
 
+    def load_channel(self, name):
+        """
+        Get the channel, fetching it
+
+        Returns:
+            praw.models.Subreddit: the specified channel
+        """
+        channel = self.get_channel(name)
+        # Force HTTP GET request
+        _ = channel.title
+        return channel
+
     def create_channel(self, name, title, channel_type=CHANNEL_TYPE_PUBLIC, **other_settings):
         """
         Create a channel
@@ -316,10 +509,9 @@ class Api:
         if count is not None:
             params['count'] = count
 
-        with request_name('/r/[channel_name]/hot?count=0&limit=25&raw_json=1'):
-            return self.get_channel(channel_name).hot(
-                limit=settings.OPEN_DISCUSSIONS_CHANNEL_POST_LIMIT, params=params
-            )
+        return _listing(self.get_channel(channel_name).hot(
+            limit=settings.OPEN_DISCUSSIONS_CHANNEL_POST_LIMIT, params=params
+        ))
 
     def get_post(self, post_id):
         """
@@ -333,6 +525,41 @@ class Api:
         """
         return self.reddit.submission(id=post_id)
 
+    def load_post(self, post_id):
+        """
+        Gets the post, fetching it
+
+        Args:
+            post_id(str): the base36 id for the post
+
+        Returns:
+            praw.models.Submission: the post
+        """
+        post = self.get_post(post_id)
+        # Force HTTP GET request
+        _ = post.title
+        return post
+
+    def get_post_likes(self, post_id):
+        """
+        Args:
+            post_id(str): the base36 id for the post
+
+        Returns:
+            bool: True if the user upvoted the post, False if they downvoted it, None otherwise
+        """
+        return self.load_post(post_id).likes
+
+    def vote_post(self, post_id, direction):
+        """
+        Vote on a post
+
+        Args:
+            post_id(str): the base36 id for the post
+            direction(int): 1 to upvote, -1 to downvote, 0 to clear the vote
+        """
+        _vote(self.get_post(post_id), direction)
+
     def update_post(self, post_id, text):
         """
         Updates the post
@@ -413,6 +640,27 @@ class Api:
         """
         return self.reddit.comment(comment_id)
 
+    def get_comment_likes(self, comment_id):
+        """
+        Args:
+            comment_id(str): the base36 id for the comment
+
+        Returns:
+            bool: True if the user upvoted the comment, False if they downvoted it, None otherwise
+        """
+        # Force HTTP GET request
+        return self.get_comment(comment_id).likes
+
+    def vote_comment(self, comment_id, direction):
+        """
+        Vote on a comment
+
+        Args:
+            comment_id(str): the base36 id for the comment
+            direction(int): 1 to upvote, -1 to downvote, 0 to clear the vote
+        """
+        _vote(self.get_comment(comment_id), direction)
+
     def list_comments(self, post_id):
         """
         Lists the comments of a post_id
@@ -423,8 +671,46 @@ class Api:
         Returns:
             praw.models.CommentForest: the base of the comment tree
         """
-        with request_name("/comments/[post_id]/?limit=2048&sort=best&raw_json=1"):
-            return self.get_post(post_id).comments
+        return self.get_post(post_id).comments
+
+    def load_comments(self, post_id):
+        """
+        Load the comments of a post, leaving its 'load more comments' stubs unexpanded
+
+        Args:
+            post_id(str): the base36 id for the post
+
+        Returns:
+            FlatCommentTree: the comments of the post
+        """
+        tree = comments.new_tree('t3_{}'.format(post_id))
+        comments.add(tree, self.list_comments(post_id), _describe_comment)
+        return tree
+
+    def load_more_comments(self, tree, stub):
+        """
+        Load the comments behind a 'load more comments' stub into a tree
+
+        Args:
+            tree (FlatCommentTree): the tree
+            stub (MoreStub): one of its stubs
+
+        Returns:
+            list of MoreStub: the stubs among the loaded comments
+        """
+        if stub.count == 0:
+            # a 'continue this thread' link loads the thread below the comment it hangs off,
+            # which more_comments can't do as it only knows the post
+            submission_id = tree.post_fullname.split('_', 1)[1]
+            comment_id = tree.names[stub.parent].split('_', 1)[1]
+            _, listing = self.reddit.get(
+                'comments/{}/_/{}'.format(submission_id, comment_id),
+                params={'limit': 2048, 'sort': 'best'},
+            )
+            nodes = listing.children
+        else:
+            nodes = self.more_comments(stub.name, tree.post_fullname, stub.count, list(stub.children)).comments()
+        return comments.add(tree, nodes, _describe_comment)
 
     def more_comments(self, comment_fullname, parent_fullname, count, children=None):
         """
@@ -464,8 +750,7 @@ class Api:
         Returns:
             praw.models.Redditor: the reddit representation of the user
         """
-        with request_name("/r/[channel_name]/api/friend/?raw_json=1"):
-            self.get_channel(channel_name).contributor.add(contributor_name)
+        self.get_channel(channel_name).contributor.add(contributor_name)
         return Redditor(self.reddit, name=contributor_name)
 
     def remove_contributor(self, contributor_name, channel_name):
@@ -479,8 +764,7 @@ class Api:
         """
         # This doesn't check if a user is a moderator because they should have access to the channel
         # regardless of their contributor status
-        with request_name("/r/[channel_name]/api/unfriend/?raw_json=1"):
-            self.get_channel(channel_name).contributor.remove(contributor_name)
+        self.get_channel(channel_name).contributor.remove(contributor_name)
 
     def list_contributors(self, channel_name):
         """
@@ -492,7 +776,7 @@ class Api:
         Returns:
             praw.models.listing.generator.ListingGenerator: a generator representing the contributors in the channel
         """
-        return self.get_channel(channel_name).contributor()
+        return _listing(self.get_channel(channel_name).contributor())
 
     def add_moderator(self, moderator_name, channel_name):
         """
@@ -506,14 +790,11 @@ class Api:
             praw.models.Redditor: the reddit representation of the user
         """
         channel = self.get_channel(channel_name)
-        with request_name("/r/[channel_name]/about/moderators/?raw_json=1"):
-            mod_doesnt_exist = moderator_name not in channel.moderator()
+        mod_doesnt_exist = moderator_name not in channel.moderator()
         if mod_doesnt_exist:
-            with request_name("/r/[channel_name]/api/friend/?raw_json=1"):
-                channel.moderator.add(moderator_name)
+            channel.moderator.add(moderator_name)
             api = Api(FakeUser(moderator_name))
-            with request_name("/r/[channel_name]/api/accept_moderator_invite?raw_json=1"):
-                api.accept_invite(channel_name)
+            api.accept_invite(channel_name)
         return Redditor(self.reddit, name=moderator_name)
 
     def accept_invite(self, channel_name):
@@ -600,3 +881,44 @@ class Api:
         """
         api = Api(FakeUser(subscriber_name))
         return channel_name in (channel.display_name for channel in api.list_channels())
+
+
+def _listing(generator):
+    """
+    Args:
+        generator (praw.models.listing.generator.ListingGenerator): a lazy praw listing
+
+    Returns:
+        the listing, read into a list if OPEN_DISCUSSIONS_MATERIALIZE_LISTINGS is set
+    """
+    if settings.OPEN_DISCUSSIONS_MATERIALIZE_LISTINGS:
+        return list(generator)
+    return generator
+
+
+def _describe_comment(node):
+    """
+    Describe a praw comment or MoreComments, see open_discussions.channels.comments
+
+    Returns:
+        tuple: fullname, parent fullname, replies, and (count, children) for a stub or None
+    """
+    if isinstance(node, more.MoreComments):
+        return node.name, node.parent_id, (), (node.count, node.children)
+    return node.fullname, node.parent_id, node.replies, None
+
+
+def _vote(thing, direction):
+    """
+    Vote on a praw post or comment
+
+    Args:
+        thing (praw.models.reddit.mixins.VotableMixin): the post or comment
+        direction(int): 1 to upvote, -1 to downvote, 0 to clear the vote
+    """
+    if direction > 0:
+        thing.upvote()
+    elif direction < 0:
+        thing.downvote()
+    else:
+        thing.clear_vote()
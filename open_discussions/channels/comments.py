@@ -0,0 +1,128 @@
+"""
+Flat comment trees, and a bounded expansion of their 'load more comments' stubs
+
+A post's comments are walked iteratively into parallel arrays, the parent of each comment being
+an index into the same arrays, so deep threads neither hit the recursion limit nor keep praw's
+forest objects around. Walking works the same for praw models and the raw backend's json things,
+each backend describes its nodes with a function returning
+(fullname, parent fullname, replies, (count, children) for a stub or None for a comment).
+"""
+from array import array
+from collections import deque, namedtuple
+
+from gevent.pool import Pool
+
+# a 'load more comments' stub, parent is the index of the comment it hangs off or -1 for the post
+MoreStub = namedtuple('MoreStub', ['name', 'parent', 'count', 'children'])
+
+FlatCommentTree = namedtuple('FlatCommentTree', [
+    'post_fullname',
+    # fullname of each comment, in depth first order
+    'names',
+    # index of the parent of each comment, -1 for top-level comments
+    'parents',
+    'depths',
+    # stubs not expanded yet
+    'more',
+    # index of each comment by fullname
+    'index',
+])
+
+
+def new_tree(post_fullname):
+    """
+    Returns:
+        FlatCommentTree: a tree without any comments
+    """
+    return FlatCommentTree(post_fullname, [], array('l'), array('H'), [], {})
+
+
+def add(tree, nodes, describe):
+    """
+    Add comments and stubs to a tree, walking their replies without recursion
+
+    A node whose parent is not among its ancestors in nodes, like the flat list of comments
+    morechildren answers with, is attached to its parent already in the tree. A comment already
+    in the tree only has its replies added.
+
+    Args:
+        tree (FlatCommentTree): the tree
+        nodes (iterable): the comments and stubs to add
+        describe (callable): describes a node of the backend
+
+    Returns:
+        list of MoreStub: the stubs found
+    """
+    stubs = []
+    stack = list(reversed(list(nodes)))
+    while stack:
+        fullname, parent_fullname, replies, more = describe(stack.pop())
+        if fullname in tree.index:
+            # 'continue this thread' answers with the comment the stub hangs off
+            stack.extend(reversed(list(replies)))
+            continue
+        parent = tree.index.get(parent_fullname, -1)
+        if more is not None:
+            stubs.append(MoreStub(fullname, parent, more[0], tuple(more[1])))
+            continue
+        tree.index[fullname] = len(tree.names)
+        tree.names.append(fullname)
+        tree.parents.append(parent)
+        tree.depths.append(tree.depths[parent] + 1 if parent >= 0 else 0)
+        stack.extend(reversed(list(replies)))
+    tree.more.extend(stubs)
+    return stubs
+
+
+def describe_thing(thing):
+    """
+    Describe a reddit json thing, as the raw backend returns them
+
+    Args:
+        thing (dict): a t1 comment or a 'more' stub
+
+    Returns:
+        tuple: fullname, parent fullname, replies, and (count, children) for a stub or None
+    """
+    data = thing['data']
+    if thing['kind'] == 'more':
+        return data['name'], data['parent_id'], (), (data['count'], data['children'])
+    replies = data.get('replies')
+    return data['name'], data['parent_id'], replies['data']['children'] if replies else (), None
+
+
+def _worth_expanding(stub, min_children):
+    """
+    'continue this thread' stubs have no children, they are only expanded if min_children is 0
+
+    Returns:
+        bool: whether the policy expands the stub
+    """
+    return len(stub.children) >= min_children
+
+
+def expand_more(api, tree, limit, concurrency, min_children):
+    """
+    Expand the 'load more comments' stubs of a tree, breadth first, like a reader clicking them
+
+    Args:
+        api (Api or RawApi): the channel api, its load_more_comments loads a single stub
+        tree (FlatCommentTree): the tree, expanded in place
+        limit (int): the most stubs to expand, 0 expands none
+        concurrency (int): the most stubs loaded at once
+        min_children (int): skip stubs with fewer comments behind them
+
+    Returns:
+        int: the number of stubs expanded
+    """
+    pending = deque(stub for stub in tree.more if _worth_expanding(stub, min_children))
+    expanded = 0
+    pool = Pool(concurrency)
+    while pending and expanded < limit:
+        wave = [pending.popleft() for _ in range(min(len(pending), limit - expanded))]
+        expanded += len(wave)
+        taken = set(wave)
+        tree.more[:] = [stub for stub in tree.more if stub not in taken]
+        for stubs in pool.imap_unordered(lambda stub: api.load_more_comments(tree, stub), wave):
+            pending.extend(stub for stub in stubs if _worth_expanding(stub, min_children))
+    return expanded
@@ -11,11 +11,21 @@ from open_discussions_api.client import OpenDiscussionsApi
 from open_discussions_api.users.client import UsersApi
 from open_discussions_api.channels.client import ChannelsApi
 
-import .settings
-import .utils
+from open_discussions.channels import seeding
+from open_discussions.channels import sessions
+from open_discussions.channels import settings
+from open_discussions.channels import threads
+from open_discussions.channels import utils
+from open_discussions.util import reporting
+from open_discussions.util.registry import EntityRegistry
 
 
 fake = Faker()
+THREAD_SHAPES = threads.parse_shapes(settings.OPEN_DISCUSSIONS_THREAD_SHAPES)
+# users and channels, and the contributors, posts, comments and threads of each channel,
+# shared by every user of the process; threads are registered as (post id, number of comments)
+ENTITIES = EntityRegistry(settings.OPEN_DISCUSSIONS_ENTITY_REGISTRY_SIZE, scope_kind="channels")
+reporting.register("od_entities", ENTITIES.stats)
 
 
 class UsersChannel(TaskSet):
@@ -24,23 +34,14 @@ class UsersChannel(TaskSet):
 
     def on_start(self):
         """on_start is called before any task is scheduled """
-        self.moderators = set()
-        self.contributors = set()
-        self.posts = []
-        self.comments = []
-        self.channel = random.choice(self.parent.discussion_channels)
+        self.channel = ENTITIES.pick("channels")
         self.api = self.parent.api
 
     def get_client_for(self, username):
         """
-        Creates an autenticated client
+        Gets an authenticated client, cached per username
         """
-        api = OpenDiscussionsApi(
-            settings.OPEN_DISCUSSIONS_JWT_SECRET,
-            settings.OPEN_DISCUSSIONS_BASE_URL,
-            username,
-        )
-        return api._get_authenticated_session()
+        return sessions.CACHE.get(username)
 
     @task
     def stop(self):
@@ -50,36 +51,36 @@ class UsersChannel(TaskSet):
     @task
     def add_moderator(self):
         """Adds a moderator to the channel"""
-        username = random.choice(self.parent.discussion_usernames)
+        username = ENTITIES.pick("users")
         self.api.channels.add_moderator(self.channel, username)
         self.api.channels.add_subscriber(self.channel, username)
-        self.moderators.add(username)
+        ENTITIES.add(("moderators", self.channel), username)
 
     @task(10)
     def add_contributor(self):
         """Adds a contributor to the channel"""
-        username = random.choice(self.parent.discussion_usernames)
+        username = ENTITIES.pick("users")
         self.api.channels.add_contributor(self.channel, username)
         self.api.channels.add_subscriber(self.channel, username)
-        self.contributors.add(username)
+        ENTITIES.add(("contributors", self.channel), username)
 
     @task(6)
     def remove_contributor(self):
         """Removes a contributor from the channel"""
         try:
-            username = random.choice(list(self.contributors))
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
             # no contributors
             return
         self.api.channels.remove_subscriber(self.channel, username)
         self.api.channels.remove_contributor(self.channel, username)
-        self.contributors.remove(username)
+        ENTITIES.remove(("contributors", self.channel), username)
 
     @task(20)
     def load_frontpage(self):
         """Hits the frontpage api"""
         try:
-            username = random.choice(list(self.contributors))
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
             # this means that this started before creating contributors
             return
@@ -90,7 +91,7 @@ class UsersChannel(TaskSet):
     def load_channels(self):
         """Hits the channel api"""
         try:
-            username = random.choice(list(self.contributors))
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
             # this means that this started before creating contributors
             return
@@ -101,7 +102,7 @@ class UsersChannel(TaskSet):
     def load_channel_posts(self):
         """Hits the channel posts api"""
         try:
-            username = random.choice(list(self.contributors))
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
             # this means that this started before creating contributors
             return
@@ -115,8 +116,8 @@ class UsersChannel(TaskSet):
     def load_post_comments(self):
         """Loads the post comments"""
         try:
-            username = random.choice(list(self.contributors))
-            post_id = random.choice(self.posts)
+            username = ENTITIES.pick(("contributors", self.channel))
+            post_id = ENTITIES.pick(("posts", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
@@ -132,7 +133,7 @@ class UsersChannel(TaskSet):
         creates a post for an user
         """
         try:
-            username = random.choice(list(self.contributors))
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
             # this means that this started before creating contributors
             return
@@ -146,7 +147,7 @@ class UsersChannel(TaskSet):
             },
             name='/api/v0/channels/[channel_name]/posts/'
         )
-        self.posts.append(res.json()['id'])
+        ENTITIES.add(("posts", self.channel), res.json()['id'])
 
     @task(10)
     def create_comment(self):
@@ -154,8 +155,8 @@ class UsersChannel(TaskSet):
         Creates a comment for a post
         """
         try:
-            username = random.choice(list(self.contributors))
-            post_id = random.choice(self.posts)
+            username = ENTITIES.pick(("contributors", self.channel))
+            post_id = ENTITIES.pick(("posts", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
@@ -165,7 +166,66 @@ class UsersChannel(TaskSet):
             json={"text": fake.paragraph()},
             name='/api/v0/posts/[post_id]/comments/'
         )
-        self.comments.append(res.json()['id'])
+        ENTITIES.add(("comments", self.channel), res.json()['id'])
+
+    @task(settings.OPEN_DISCUSSIONS_THREAD_CREATE_WEIGHT)
+    def create_thread(self):
+        """
+        Creates a post with a comment thread of one of the configured shapes
+        """
+        try:
+            username = ENTITIES.pick(("contributors", self.channel))
+        except IndexError:
+            # this means that this started before creating contributors
+            return
+        shape = random.choice(THREAD_SHAPES)
+        client = self.get_client_for(username)
+        res = client.post(
+            '/api/v0/channels/{}/posts/'.format(self.channel),
+            json={
+                'title': ' '.join(fake.paragraph().split(' ')[:2]),
+                'text': fake.paragraph(),
+                'upvoted': False,
+            },
+            name='/api/v0/channels/[channel_name]/posts/'
+        )
+        if res.status_code != 201:
+            return
+        post_id = res.json()['id']
+
+        def reply(comment_id):
+            payload = {"text": fake.paragraph()}
+            if comment_id is not None:
+                payload["comment_id"] = comment_id
+            res = client.post(
+                '/api/v0/posts/{}/comments/'.format(post_id),
+                json=payload,
+                name='/api/v0/posts/[post_id]/comments/'
+            )
+            if res.status_code != 201:
+                return None
+            return res.json()['id']
+
+        created = threads.build_thread(reply, shape, settings.OPEN_DISCUSSIONS_THREAD_CONCURRENCY)
+        for comment_id in created:
+            ENTITIES.add(("comments", self.channel), comment_id)
+        # tagged with the comments actually created, failed replies leave a thread smaller than its shape
+        ENTITIES.add(("threads", self.channel), (post_id, len(created)))
+
+    @task(settings.OPEN_DISCUSSIONS_THREAD_LOAD_WEIGHT)
+    def load_thread(self):
+        """Loads the comments of a thread built by create_thread, named after the size of the thread"""
+        try:
+            username = ENTITIES.pick(("contributors", self.channel))
+            post_id, comment_count = ENTITIES.pick(("threads", self.channel))
+        except IndexError:
+            # this means that this started before creating contributors or threads
+            return
+        client = self.get_client_for(username)
+        client.get(
+            '/api/v0/posts/{}/comments/'.format(post_id),
+            name='/api/v0/posts/[post_id]/comments/' + threads.size_tag(comment_count),
+        )
 
     @task(20)
     def upvote_post(self):
@@ -173,8 +233,8 @@ class UsersChannel(TaskSet):
         Upvotes a post
         """
         try:
-            username = random.choice(list(self.contributors))
-            post_id = random.choice(self.posts)
+            username = ENTITIES.pick(("contributors", self.channel))
+            post_id = ENTITIES.pick(("posts", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
@@ -191,8 +251,8 @@ class UsersChannel(TaskSet):
         Clear vote for a post
         """
         try:
-            username = random.choice(list(self.contributors))
-            post_id = random.choice(self.posts)
+            username = ENTITIES.pick(("contributors", self.channel))
+            post_id = ENTITIES.pick(("posts", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
@@ -209,8 +269,8 @@ class UsersChannel(TaskSet):
         Upvotes a comment
         """
         try:
-            username = random.choice(list(self.contributors))
-            comment_id = random.choice(self.comments)
+            username = ENTITIES.pick(("contributors", self.channel))
+            comment_id = ENTITIES.pick(("comments", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
@@ -227,8 +287,8 @@ class UsersChannel(TaskSet):
         Downvotes a comment
         """
         try:
-            username = random.choice(list(self.contributors))
-            comment_id = random.choice(self.comments)
+            username = ENTITIES.pick(("contributors", self.channel))
+            comment_id = ENTITIES.pick(("comments", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
@@ -242,8 +302,8 @@ class UsersChannel(TaskSet):
     @task(5)
     def clear_vote_comment(self):
         try:
-            username = random.choice(list(self.contributors))
-            comment_id = random.choice(self.comments)
+            username = ENTITIES.pick(("contributors", self.channel))
+            comment_id = ENTITIES.pick(("comments", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
@@ -267,8 +327,7 @@ class UserBehavior(TaskSet):
 
     def on_start(self):
         """on_start is called before any task is scheduled """
-        self.discussion_usernames = []
-        self.discussion_channels = []
+        self.users_created = 0
 
         # monkey patch the library client
         OpenDiscussionsApi._get_session = utils.patch_get_session(self.client)
@@ -287,6 +346,13 @@ class UserBehavior(TaskSet):
             roles=['staff']
         )
 
+        if settings.OPEN_DISCUSSIONS_SEED_MANIFEST:
+            # start from the seeded data, read from the manifest or seeded once
+            for data in seeding.seed_once(self.api):
+                self.register_seeded(data)
+            if ENTITIES.count("users") and ENTITIES.count("channels"):
+                return
+
         # create a some users to play with
         for _ in range(2):
             self.create_user()
@@ -294,15 +360,36 @@ class UserBehavior(TaskSet):
         for _ in range(1):
             self.create_channel()
 
+    def register_seeded(self, data):
+        """
+        Register the seeded users, each a contributor to every seeded channel of its share,
+        and the seeded posts and comments
+
+        Args:
+            data (seeding.SeedData): a share of the seeded data
+        """
+        usernames = data.usernames[:self.discussion_usernames_number]
+        for username in usernames:
+            ENTITIES.add("users", username)
+        for channel in data.channels:
+            ENTITIES.add("channels", channel)
+            for username in usernames:
+                ENTITIES.add(("contributors", channel), username)
+        for channel, post_id in data.posts:
+            ENTITIES.add(("posts", channel), post_id)
+        for channel, comment_id in data.comments:
+            ENTITIES.add(("comments", channel), comment_id)
+
     def create_user(self):
         """creates an user in the system"""
         # limit the number of users
-        if len(self.discussion_usernames) >= self.discussion_usernames_number:
+        if self.users_created >= self.discussion_usernames_number:
             return
         res = self.api.users.create(name=fake.name(), image=None, image_small=None, image_medium=None)
         if res.status_code != 201:
             return
-        self.discussion_usernames.append(res.json()['username'])
+        self.users_created += 1
+        ENTITIES.add("users", res.json()['username'])
 
     def create_channel(self):
         """Create a channel"""
@@ -315,7 +402,7 @@ class UserBehavior(TaskSet):
         )
         if res.status_code != 201:
             return
-        self.discussion_channels.append(name)
+        ENTITIES.add("channels", name)
 
     @task
     def create_additional_channel(self):
@@ -331,7 +418,7 @@ class UserBehavior(TaskSet):
     def update_user(self):
         """updates an user in the system"""
         self.api.users.update(
-            username=random.choice(self.discussion_usernames),
+            username=ENTITIES.pick("users"),
             name=fake.name(),
             image=None,
             image_small=None,
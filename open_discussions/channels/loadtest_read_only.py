@@ -4,19 +4,16 @@ This test focuses on the reads
 """
 
 import random
-import time
-import uuid
 
-from faker import Faker
 from locust import HttpLocust, TaskSet, task
 from open_discussions_api.client import OpenDiscussionsApi
 from open_discussions_api.users.client import UsersApi
 from open_discussions_api.channels.client import ChannelsApi
 
-import .settings
-import .utils
-
-fake = Faker()
+from open_discussions.channels import seeding
+from open_discussions.channels import sessions
+from open_discussions.channels import settings
+from open_discussions.channels import utils
 
 
 class UserBehavior(TaskSet):
@@ -25,10 +22,6 @@ class UserBehavior(TaskSet):
 
     def on_start(self):
         """on_start is called before any task is scheduled """
-        self.usernames = []
-        self.channels = []
-        self.posts = []
-
         # monkey patch the library client
         OpenDiscussionsApi._get_session = utils.patch_get_session(self.client)
         UsersApi.update = utils.patched_user_update
@@ -46,109 +39,18 @@ class UserBehavior(TaskSet):
             roles=['staff']
         )
 
-        # create a some users to play with
-        self.create_users()
-        # create some channels
-        self.create_channels()
-        # add contributors
-        self.add_contributors()
-        self.add_posts()
-        self.add_comments()
-        time.sleep(settings.WAIT_BEFORE_LOAD_TEST_SECONDS)
+        # every user waits for the data seeded once per worker, and reads one worker's share of it
+        shards = seeding.seed_once(self.api)
+        data = random.choice([shard for shard in shards if shard.posts] or shards)
+        self.usernames = data.usernames
+        self.channels = data.channels
+        self.posts = [post_id for _, post_id in data.posts]
 
     def get_client_for(self, username):
         """
-        Creates an autenticated client
-        """
-        api = OpenDiscussionsApi(
-            settings.OPEN_DISCUSSIONS_JWT_SECRET,
-            settings.OPEN_DISCUSSIONS_BASE_URL,
-            username,
-        )
-        return api._get_authenticated_session()
-
-    def create_users(self):
-        """creates users in the system"""
-        for _ in range(settings.USERS_TO_CREATE):
-            res = self.api.users.create(name=fake.name(), image=None, image_small=None, image_medium=None)
-            time.sleep(settings.POST_WAIT_SECONDS)
-            if res.status_code != 201:
-                return
-            self.usernames.append(res.json()['username'])
-
-    def create_channels(self):
-        """Create channels"""
-        for _ in range(settings.CHANNELS_TO_CREATE):
-            name = '_'.join(fake.paragraph().split(' ')[:2]).lower()
-            res = self.api.channels.create(
-                title=' '.join(fake.paragraph().split(' ')[:2]),
-                name=name,
-                public_description=fake.paragraph(),
-                channel_type='private',
-            )
-            time.sleep(settings.POST_WAIT_SECONDS)
-            if res.status_code != 201:
-                return
-            self.channels.append(name)
-        # let's let reddit digest the posts
-        time.sleep(5)
-
-    def add_contributors(self):
-        """Adds a contributor to the channel"""
-        for channel in self.channels:
-            for username in self.usernames:
-                self.api.channels.add_contributor(channel, username)
-                self.api.channels.add_subscriber(channel, username)
-                time.sleep(settings.POST_WAIT_SECONDS)
-        # let's let reddit digest the posts
-        time.sleep(5)
-
-    def add_posts(self):
-        """
-        creates posts
-        """
-        for channel in self.channels:
-            for _ in range(settings.POSTS_PER_CHANNEL):
-                try:
-                    username = random.choice(list(self.usernames))
-                except IndexError:
-                    # this means that this started before creating contributors
-                    return
-                client = self.get_client_for(username)
-                res = client.post(
-                    '/api/v0/channels/{}/posts/'.format(channel),
-                    json={
-                        'title': ' '.join(fake.paragraph().split(' ')[:2]),
-                        'text': fake.paragraph(),
-                        'upvoted': False,
-                    },
-                    name='/api/v0/channels/[channel_name]/posts/'
-                )
-                self.posts.append(res.json()['id'])
-                time.sleep(settings.POST_WAIT_SECONDS)
-        # let's let reddit digest the posts
-        time.sleep(5)
-
-    def add_comments(self):
-        """
-        Creates comments for posts
+        Gets an authenticated client, cached per username
         """
-        for post_id in self.posts:
-            for _ in range(settings.COMMENTS_PER_POST):
-                try:
-                    username = random.choice(list(self.usernames))
-                except IndexError:
-                    # this means that this started before creating contributors or posts
-                    return
-                client = self.get_client_for(username)
-                client.post(
-                    '/api/v0/posts/{}/comments/'.format(post_id),
-                    json={"text": fake.paragraph()},
-                    name='/api/v0/posts/[post_id]/comments/'
-                )
-                time.sleep(settings.POST_WAIT_SECONDS)
-        # let's let reddit digest the posts
-        time.sleep(5)
+        return sessions.CACHE.get(username)
 
     @task
     def index(self):
@@ -161,7 +63,7 @@ class UserBehavior(TaskSet):
         try:
             username = random.choice(list(self.usernames))
         except IndexError:
-            # this means that this started before creating contributors
+            # this means that the share read has no users
             return
         client = self.get_client_for(username)
         client.get('/api/v0/frontpage/')
@@ -172,7 +74,7 @@ class UserBehavior(TaskSet):
         try:
             username = random.choice(list(self.usernames))
         except IndexError:
-            # this means that this started before creating contributors
+            # this means that the share read has no users
             return
         client = self.get_client_for(username)
         client.get('/api/v0/channels/')
@@ -182,12 +84,13 @@ class UserBehavior(TaskSet):
         """Hits the channel posts api"""
         try:
             username = random.choice(list(self.usernames))
+            channel = random.choice(list(self.channels))
         except IndexError:
-            # this means that this started before creating contributors
+            # this means that the share read has no users or channels
             return
         client = self.get_client_for(username)
         client.get(
-            '/api/v0/channels/{}/posts/'.format(random.choice(list(self.channels))),
+            '/api/v0/channels/{}/posts/'.format(channel),
             name='/api/v0/channels/[channel_name]/posts/',
         )
 
@@ -198,7 +101,7 @@ class UserBehavior(TaskSet):
             username = random.choice(list(self.usernames))
             post_id = random.choice(self.posts)
         except IndexError:
-            # this means that this started before creating contributors or posts
+            # this means that the share read has no users or posts
             return
         client = self.get_client_for(username)
         client.get(
@@ -5,36 +5,83 @@ import random
 import uuid
 
 from faker import Faker
-from locust import HttpLocust, TaskSet, task
+from locust import HttpLocust, task
 
-import .settings
-import .channel_api
+from open_discussions.channels import settings
+from open_discussions.channels import channel_api
+from open_discussions.channels import comments
+from open_discussions.channels import pagination
+from open_discussions.channels import threads
+from open_discussions.channels.audit import AuditedTaskSet, expects, ignore
+from open_discussions.channels.vault import REFRESH_TOKEN_PATH
+from open_discussions.util import reporting
+from open_discussions.util.cache import LRUCache
+from open_discussions.util.registry import EntityRegistry
 
 
 fake = Faker()
+# building a client may request a refresh token and an access token in any task
+ignore(REFRESH_TOKEN_PATH, "/api/v1/access_token")
+THREAD_SHAPES = threads.parse_shapes(settings.OPEN_DISCUSSIONS_THREAD_SHAPES)
+PAGINATION_DEPTHS = pagination.parse_depths(settings.OPEN_DISCUSSIONS_PAGINATION_DEPTHS)
+# users and channels, and the contributors, posts and comments of each channel, shared by every user of the process
+ENTITIES = EntityRegistry(settings.OPEN_DISCUSSIONS_ENTITY_REGISTRY_SIZE, scope_kind="channels")
+reporting.register("reddit_entities", ENTITIES.stats)
+
+# the last vote of each (username, kind, id), what blind votes go by instead of reading likes
+VOTE_STATE = LRUCache(settings.OPEN_DISCUSSIONS_VOTE_STATE_SIZE)
+VOTE_STATS = {"cast": 0, "skipped": 0}
+reporting.register("reddit_vote_state", VOTE_STATE.stats)
+reporting.register("reddit_votes", lambda: dict(VOTE_STATS))
+# vote directions by the likes reddit reports
+DIRECTIONS = {True: 1, False: -1, None: 0}
 
 
 def make_api_client(username):
-    return channel_api.Api(channel_api.FakeUser(username))
-
-
-def recurse_comments(comment_tree):
-    comments = list(comment_tree)
-    for comment in comments:
-        recurse_comments(comment.replies)
+    return channel_api.make_api(channel_api.FakeUser(username))
+
+
+def vote(username, kind, thing_id, direction):
+    """
+    Vote on a post or comment unless the user already voted that way
+
+    The current vote is read from reddit first, unless OPEN_DISCUSSIONS_VOTE_READ_BEFORE is off
+    and the vote goes by the last vote recorded locally. It is read again afterwards unless
+    OPEN_DISCUSSIONS_VOTE_READ_AFTER is off. With both off only votes are sent.
+
+    Args:
+        username (str): the voting user
+        kind (str): 'post' or 'comment'
+        thing_id (str): the base36 id of the post or comment
+        direction (int): 1 to upvote, -1 to downvote, 0 to clear the vote
+    """
+    key = (username, kind, thing_id)
+    api = make_api_client(username)
+    if settings.OPEN_DISCUSSIONS_VOTE_READ_BEFORE:
+        current = DIRECTIONS[getattr(api, 'get_{}_likes'.format(kind))(thing_id)]
+    else:
+        current = VOTE_STATE.get(key, 0)
+
+    if current != direction:
+        getattr(api, 'vote_{}'.format(kind))(thing_id, direction)
+        VOTE_STATS["cast"] += 1
+    else:
+        VOTE_STATS["skipped"] += 1
+    VOTE_STATE.put(key, direction)
+
+    if settings.OPEN_DISCUSSIONS_VOTE_READ_AFTER:
+        # Due to the way the DRF view works we actually fetch API client twice
+        api = make_api_client(username)
+        getattr(api, 'get_{}_likes'.format(kind))(thing_id)
 
 
-class UsersChannel(TaskSet):
+class UsersChannel(AuditedTaskSet):
     """Tasks for a user interacting with a subreddit"""
     tasks = {}
 
     def on_start(self):
         """on_start is called before any task is scheduled """
-        self.moderators = set()
-        self.contributors = set()
-        self.posts = []
-        self.comments = []
-        self.channel = random.choice(self.parent.discussion_channels)
+        self.channel = ENTITIES.pick("channels")
 
     @task
     def stop(self):
@@ -42,43 +89,51 @@ class UsersChannel(TaskSet):
         self.interrupt()
 
     @task
+    @expects(
+        "/r/[channel_name]/about/moderators/",
+        "/api/subscribe/",
+        optional=("/r/[channel_name]/api/friend/", "/r/[channel_name]/api/accept_moderator_invite/"),
+    )
     def add_moderator(self):
         """Adds a moderator to the channel"""
-        username = random.choice(self.parent.discussion_usernames)
+        username = ENTITIES.pick("users")
         api = make_api_client(settings.OPEN_DISCUSSIONS_API_USERNAME)
         api.add_moderator(username, self.channel)
         api.add_subscriber(username, self.channel)
 
-        self.moderators.add(username)
+        ENTITIES.add(("moderators", self.channel), username)
 
     @task(10)
+    @expects("/r/[channel_name]/api/friend/", "/api/subscribe/")
     def add_contributor(self):
         """Adds a contributor to the channel"""
-        username = random.choice(self.parent.discussion_usernames)
+        username = ENTITIES.pick("users")
         api = make_api_client(settings.OPEN_DISCUSSIONS_API_USERNAME)
         api.add_contributor(username, self.channel)
         api.add_subscriber(username, self.channel)
 
-        self.contributors.add(username)
+        ENTITIES.add(("contributors", self.channel), username)
 
     @task(6)
+    @expects("/api/subscribe/", "/r/[channel_name]/api/unfriend/")
     def remove_contributor(self):
         """Removes a contributor from the channel"""
         try:
-            username = random.choice(list(self.contributors))
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
             # no contributors
             return
         api = make_api_client(settings.OPEN_DISCUSSIONS_API_USERNAME)
         api.remove_subscriber(username, self.channel)
         api.remove_contributor(username, self.channel)
-        self.contributors.remove(username)
+        ENTITIES.remove(("contributors", self.channel), username)
 
     @task(20)
+    @expects("/hot")
     def load_frontpage(self):
         """Hits the frontpage api"""
         try:
-            username = random.choice(list(self.contributors))
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
             # this means that this started before creating contributors
             return
@@ -86,39 +141,82 @@ class UsersChannel(TaskSet):
         api.front_page()
 
     @task(20)
+    @expects("/r/[channel_name]/hot")
     def load_channel_posts(self):
         """Hits the channel posts api"""
         try:
-            username = random.choice(list(self.contributors))
+            username = ENTITIES.pick(("contributors", self.channel))
+        except IndexError:
+            # this means that this started before creating contributors
+            return
+        api = make_api_client(username)
+        list(api.list_posts(self.channel))
+
+    @task(settings.OPEN_DISCUSSIONS_PAGINATION_WEIGHT)
+    @expects("/hot")
+    def page_frontpage(self):
+        """Reads the frontpage several pages deep"""
+        try:
+            username = ENTITIES.pick(("contributors", self.channel))
+        except IndexError:
+            # this means that this started before creating contributors
+            return
+        api = make_api_client(username)
+        pagination.walk_pages(
+            api.front_page,
+            pagination.pick_depth(PAGINATION_DEPTHS),
+            channel_api.thing_fullname,
+            settings.OPEN_DISCUSSIONS_CHANNEL_POST_LIMIT,
+        )
+
+    @task(settings.OPEN_DISCUSSIONS_PAGINATION_WEIGHT)
+    @expects("/r/[channel_name]/hot")
+    def page_channel_posts(self):
+        """Reads the channel posts several pages deep"""
+        try:
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
             # this means that this started before creating contributors
             return
         api = make_api_client(username)
-        api.list_posts(self.channel)
+        pagination.walk_pages(
+            lambda **page: api.list_posts(self.channel, **page),
+            pagination.pick_depth(PAGINATION_DEPTHS),
+            channel_api.thing_fullname,
+            settings.OPEN_DISCUSSIONS_CHANNEL_POST_LIMIT,
+        )
 
     @task(20)
+    @expects(
+        "/comments/[post_id]/",
+        optional=("/api/morechildren/", "/comments/[post_id]/_/[comment_id]/"),
+    )
     def load_post_comments(self):
         """Loads the post comments"""
         try:
-            username = random.choice(list(self.contributors))
-            post_id = random.choice(self.posts)
+            username = ENTITIES.pick(("contributors", self.channel))
+            post_id = ENTITIES.pick(("posts", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
         api = make_api_client(username)
-
-        # TODO: how to group comment requests by name?
-        comment_tree = api.list_comments(post_id)
-        comment_tree.replace_more(limit=0)
-        recurse_comments(comment_tree)
+        comment_tree = api.load_comments(post_id)
+        comments.expand_more(
+            api,
+            comment_tree,
+            limit=settings.OPEN_DISCUSSIONS_REDDIT_MORE_COMMENTS_LIMIT,
+            concurrency=settings.OPEN_DISCUSSIONS_REDDIT_MORE_COMMENTS_CONCURRENCY,
+            min_children=settings.OPEN_DISCUSSIONS_REDDIT_MORE_COMMENTS_MIN_CHILDREN,
+        )
 
     @task(6)
+    @expects("/api/submit/", "/comments/[post_id]/")
     def create_post(self):
         """
         creates a post for an user
         """
         try:
-            username = random.choice(list(self.contributors))
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
             # this means that this started before creating contributors
             return
@@ -128,19 +226,19 @@ class UsersChannel(TaskSet):
             title=' '.join(fake.paragraph().split(' ')[:2]),
             text=fake.paragraph(),
         )
-        # Force HTTP GET request
-        with channel_api.request_name("/comments/[post_id]/?limit=2048&sort=best&raw_json=1"):
-            _ = post.title
-        self.posts.append(post.id)
+        post_id = channel_api.thing_id(post)
+        api.load_post(post_id)
+        ENTITIES.add(("posts", self.channel), post_id)
 
     @task(10)
+    @expects("/api/comment/")
     def create_comment(self):
         """
         Creates a comment for a post
         """
         try:
-            username = random.choice(list(self.contributors))
-            post_id = random.choice(self.posts)
+            username = ENTITIES.pick(("contributors", self.channel))
+            post_id = ENTITIES.pick(("posts", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
@@ -149,150 +247,106 @@ class UsersChannel(TaskSet):
             text=fake.paragraph(),
             post_id=post_id,
         )
-        self.comments.append(comment.id)
+        ENTITIES.add(("comments", self.channel), channel_api.thing_id(comment))
 
-    @task(20)
-    def upvote_post(self):
+    @task(settings.OPEN_DISCUSSIONS_THREAD_CREATE_WEIGHT)
+    @expects("/api/submit/", "/api/comment/")
+    def create_thread(self):
         """
-        Upvotes a post
+        Creates a post with a comment thread of one of the configured shapes
         """
         try:
-            username = random.choice(list(self.contributors))
-            post_id = random.choice(self.posts)
+            username = ENTITIES.pick(("contributors", self.channel))
         except IndexError:
-            # this means that this started before creating contributors or posts
+            # this means that this started before creating contributors
             return
+        shape = random.choice(THREAD_SHAPES)
         api = make_api_client(username)
-        post = api.get_post(post_id)
-        # Force HTTP GET request
-        with channel_api.request_name("/comments/[post_id]/?limit=2048&sort=best&raw_json=1"):
-            already_upvoted = post.likes is True
+        post_id = channel_api.thing_id(api.create_post(
+            channel_name=self.channel,
+            title=' '.join(fake.paragraph().split(' ')[:2]),
+            text=fake.paragraph(),
+        ))
 
-        if not already_upvoted:
-            post.upvote()
+        def reply(comment_id):
+            if comment_id is None:
+                comment = api.create_comment(text=fake.paragraph(), post_id=post_id)
+            else:
+                comment = api.create_comment(text=fake.paragraph(), comment_id=comment_id)
+            return channel_api.thing_id(comment)
 
-        # Due to the way the DRF view works we actually fetch API client twice
-        api = make_api_client(username)
-        post = api.get_post(post_id)
+        for comment_id in threads.build_thread(reply, shape, settings.OPEN_DISCUSSIONS_THREAD_CONCURRENCY):
+            ENTITIES.add(("comments", self.channel), comment_id)
+        ENTITIES.add(("posts", self.channel), post_id)
 
-        with channel_api.request_name("/comments/[post_id]/?limit=2048&sort=best&raw_json=1"):
-            # Force HTTP get request
-            _ = post.title
+    @task(20)
+    @expects(optional=("/comments/[post_id]/", "/api/vote/"))
+    def upvote_post(self):
+        """
+        Upvotes a post
+        """
+        try:
+            username = ENTITIES.pick(("contributors", self.channel))
+            post_id = ENTITIES.pick(("posts", self.channel))
+        except IndexError:
+            # this means that this started before creating contributors or posts
+            return
+        vote(username, 'post', post_id, 1)
 
     @task(5)
+    @expects(optional=("/comments/[post_id]/", "/api/vote/"))
     def clear_vote_post(self):
         """Clear the vote on a post"""
         try:
-            username = random.choice(list(self.contributors))
-            post_id = random.choice(self.posts)
+            username = ENTITIES.pick(("contributors", self.channel))
+            post_id = ENTITIES.pick(("posts", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
-        api = make_api_client(username)
-        post = api.get_post(post_id)
-        # Force HTTP GET request
-        with channel_api.request_name("/comments/[post_id]/?limit=2048&sort=best&raw_json=1"):
-            # Technically this should never be False, just True or None, but just in case
-            not_already_upvoted = post.likes is not True
-
-        if not not_already_upvoted:
-            post.clear_vote()
-
-        # Due to the way the DRF view works we actually fetch API client twice
-        api = make_api_client(username)
-        post = api.get_post(post_id)
-
-        with channel_api.request_name("/comments/[post_id]/?limit=2048&sort=best&raw_json=1"):
-            # Force HTTP get request
-            _ = post.title
+        vote(username, 'post', post_id, 0)
 
     @task(20)
+    @expects(optional=("/api/info/", "/api/vote/"))
     def upvote_comment(self):
         """
         Upvotes a comment
         """
         try:
-            username = random.choice(list(self.contributors))
-            comment_id = random.choice(self.comments)
+            username = ENTITIES.pick(("contributors", self.channel))
+            comment_id = ENTITIES.pick(("comments", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
-
-        api = make_api_client(username)
-        comment = api.get_comment(comment_id)
-        # Force HTTP GET request
-        with channel_api.request_name("/api/info?id=[comment_id]&raw_json=1"):
-            likes = comment.likes
-
-        if likes is not True:
-            comment.upvote()
-
-        # Due to the way the DRF view works we actually fetch API client twice
-        api = make_api_client(username)
-        comment = api.get_comment(comment_id)
-
-        with channel_api.request_name("/api/info?id=[comment_id]&raw_json=1"):
-            # Force HTTP get request
-            _ = comment.likes
+        vote(username, 'comment', comment_id, 1)
 
     @task(20)
+    @expects(optional=("/api/info/", "/api/vote/"))
     def downvote_comment(self):
         """
         Downvotes a comment
         """
         try:
-            username = random.choice(list(self.contributors))
-            comment_id = random.choice(self.comments)
+            username = ENTITIES.pick(("contributors", self.channel))
+            comment_id = ENTITIES.pick(("comments", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
-
-        api = make_api_client(username)
-        comment = api.get_comment(comment_id)
-        # Force HTTP GET request
-        with channel_api.request_name("/api/info?id=[comment_id]&raw_json=1"):
-            likes = comment.likes
-
-        if likes is not False:
-            comment.downvote()
-
-        # Due to the way the DRF view works we actually fetch API client twice
-        api = make_api_client(username)
-        comment = api.get_comment(comment_id)
-
-        with channel_api.request_name("/api/info?id=[comment_id]&raw_json=1"):
-            # Force HTTP get request
-            _ = comment.likes
+        vote(username, 'comment', comment_id, -1)
 
     @task(5)
+    @expects(optional=("/api/info/", "/api/vote/"))
     def clear_vote_comment(self):
         """Clear the vote of a comment"""
         try:
-            username = random.choice(list(self.contributors))
-            comment_id = random.choice(self.comments)
+            username = ENTITIES.pick(("contributors", self.channel))
+            comment_id = ENTITIES.pick(("comments", self.channel))
         except IndexError:
             # this means that this started before creating contributors or posts
             return
+        vote(username, 'comment', comment_id, 0)
 
-        api = make_api_client(username)
-        comment = api.get_comment(comment_id)
-        # Force HTTP GET request
-        with channel_api.request_name("/api/info?id=[comment_id]&raw_json=1"):
-            likes = comment.likes
-
-        if likes is not None:
-            comment.clear_vote()
-
-        # Due to the way the DRF view works we actually fetch API client twice
-        api = make_api_client(username)
-        comment = api.get_comment(comment_id)
-
-        with channel_api.request_name("/api/info?id=[comment_id]&raw_json=1"):
-            # Force HTTP get request
-            _ = comment.likes
 
-
-class UserBehavior(TaskSet):
+class UserBehavior(AuditedTaskSet):
     """Tasks for testing reddit PRAW client"""
     tasks = {UsersChannel: 10}
 
@@ -300,8 +354,7 @@ class UserBehavior(TaskSet):
 
     def on_start(self):
         """on_start is called before any task is scheduled """
-        self.discussion_usernames = []
-        self.discussion_channels = []
+        self.users_created = 0
 
         channel_api.LOCUST_SESSION = self.client
         channel_api.patch_locust_request()
@@ -316,12 +369,16 @@ class UserBehavior(TaskSet):
     def create_user(self):
         """creates an user in the system"""
         # limit the number of users
-        if len(self.discussion_usernames) >= self.discussion_usernames_number:
+        if self.users_created >= self.discussion_usernames_number:
             return
 
-        username = uuid.uuid4().hex
-        channel_api.get_or_create_user(username)
-        self.discussion_usernames.append(username)
+        # prefer users provisioned ahead of the run, they already have a refresh token
+        username = channel_api.provisioned_username()
+        if username is None:
+            username = uuid.uuid4().hex
+            channel_api.get_or_create_user(username)
+        self.users_created += 1
+        ENTITIES.add("users", username)
 
     def create_channel(self):
         """Create a channel"""
@@ -335,25 +392,26 @@ class UserBehavior(TaskSet):
             public_description=fake.paragraph(),
             channel_type='private',
         )
-        with channel_api.request_name("/r/[channel_name]/about/?raw_json=1"):
-            # access title to force an HTTP request
-            _ = api.get_channel(name).title
-        self.discussion_channels.append(name)
+        api.load_channel(name)
+        ENTITIES.add("channels", name)
 
     @task
+    @expects("/api/site_admin/", "/r/[channel_name]/about/")
     def create_additional_channel(self):
         """New channels are occasional"""
         self.create_channel()
 
     @task
+    @expects(optional=(REFRESH_TOKEN_PATH,))
     def create_additional_user(self):
         """New users are occasional"""
         self.create_user()
 
-    @task(5)
+    @task(settings.OPEN_DISCUSSIONS_REDDIT_TOKEN_TASK_WEIGHT)
+    @expects(REFRESH_TOKEN_PATH)
     def update_user(self):
-        """updates an user in the system"""
-        channel_api.get_or_create_user(random.choice(self.discussion_usernames))
+        """updates an user in the system, always requesting a new refresh token"""
+        channel_api.get_or_create_user(ENTITIES.pick("users"))
 
 
 class WebsiteUser(HttpLocust):
@@ -0,0 +1,98 @@
+"""
+Walking listings several pages deep
+
+How deep a user pages is drawn from a distribution of "pages:weight" pairs, and listing requests
+past the first page are named after a bucket of their page number (see routes.route_name), so
+the stats show where listing latency falls apart as users page deeper into large channels.
+"""
+import random
+
+PAGE_BUCKETS = (
+    (1, "1"),
+    (2, "2"),
+    (4, "3-4"),
+    (8, "5-8"),
+    (16, "9-16"),
+)
+LAST_PAGE_BUCKET = "17+"
+
+
+def parse_depths(value):
+    """
+    Args:
+        value (str): comma separated pages:weight pairs, like "1:50,2:25,4:15,8:10"
+
+    Returns:
+        (list of int, list of int): the depths and their weights
+    """
+    depths, weights = [], []
+    for pair in value.split(','):
+        depth, weight = (int(part) for part in pair.split(':'))
+        if depth < 1 or weight < 0:
+            raise ValueError('Invalid pagination depth {}'.format(pair))
+        depths.append(depth)
+        weights.append(weight)
+    return depths, weights
+
+
+def pick_depth(distribution):
+    """
+    Args:
+        distribution ((list of int, list of int)): depths and weights, as parse_depths returns
+
+    Returns:
+        int: the number of pages to walk
+    """
+    depths, weights = distribution
+    return random.choices(depths, weights)[0]
+
+
+def page_bucket(page):
+    """
+    Returns:
+        str: the bucket a page number falls into
+    """
+    for upper, bucket in PAGE_BUCKETS:
+        if page <= upper:
+            return bucket
+    return LAST_PAGE_BUCKET
+
+
+def listing_page(params, default_limit):
+    """
+    The page of a listing request, from the number of items already seen
+
+    Args:
+        params (dict): the query parameters of the request
+        default_limit (int): the page size when the request doesn't say
+
+    Returns:
+        int: the 1-based page number
+    """
+    count = int(params.get('count') or 0)
+    limit = int(params.get('limit') or default_limit)
+    return count // limit + 1
+
+
+def walk_pages(fetch, depth, fullname, limit):
+    """
+    Read a listing page by page, following the fullname of the last item like reddit's next link
+
+    Args:
+        fetch (callable): takes after and count keyword arguments and returns a page of items
+        depth (int): the most pages to read
+        fullname (callable): returns the fullname of an item
+        limit (int): the page size, a shorter page is the last one
+
+    Returns:
+        int: the number of pages read
+    """
+    after = None
+    count = 0
+    for page in range(1, depth + 1):
+        items = list(fetch(after=after, count=count or None))
+        if len(items) < limit:
+            return page
+        count += len(items)
+        after = fullname(items[-1])
+    return depth
@@ -0,0 +1,639 @@
+"""
+A raw JSON reddit client, an alternative backend to praw for channel_api
+
+RawApi speaks the reddit endpoints praw uses directly over the locust session and returns the
+decoded JSON as plain dicts, so a task pays for one request and one json decode instead of
+praw's lazy model graph. It issues the same requests praw does for each Api method, select it
+with OPEN_DISCUSSIONS_REDDIT_BACKEND=raw. It never sleeps on reddit's ratelimit headers nor
+retries a request, see open_discussions.channels.throttle.
+"""
+# pylint: disable=too-many-public-methods
+from collections import namedtuple
+import time
+from urllib.parse import urljoin
+
+from requests.exceptions import HTTPError
+
+from open_discussions.channels import comments, settings
+
+ACCESS_TOKEN_PATH = '/api/v1/access_token'
+# the timeout prawcore uses
+REQUEST_TIMEOUT = 16
+# refresh the access token this many seconds before it expires
+EXPIRY_MARGIN = 10
+# praw's default limit and sort for the comments of a post
+COMMENT_LIMIT = 2048
+COMMENT_SORT = 'best'
+# praw's default limit for listings, which it also sends as the page size
+LISTING_LIMIT = 100
+RELATIONSHIP_LIMIT = 100
+# the about/edit settings praw posts back under another name, see praw's SubredditModeration.update
+EDIT_SETTINGS_REMAP = {
+    'allow_top': 'default_set',
+    'lang': 'language',
+    'link_type': 'content_options',
+}
+
+POST_PREFIX = 't3_'
+COMMENT_PREFIX = 't1_'
+
+# anything with a username will do as a user
+User = namedtuple('User', ['username'])
+
+
+class RedditAPIError(Exception):
+    """Reddit answered a request with errors in its json response"""
+
+
+class RawClient:
+    """An authorized reddit session, the raw counterpart of praw.Reddit"""
+    def __init__(self, session, reddit_url, user_agent, client_id, client_secret, refresh_token):
+        """
+        Args:
+            session (requests.Session): the session to send requests with
+            reddit_url (str): the reddit base url, used for both the www and oauth urls
+            user_agent (str): the user agent to send
+            client_id (str): the reddit app id
+            client_secret (str): the reddit app secret
+            refresh_token (str): the user's refresh token
+        """
+        self.session = session
+        self.reddit_url = reddit_url
+        self.user_agent = user_agent
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.access_token = None
+        self.expires_at = 0
+
+    def authorize(self):
+        """Exchange the refresh token for an access token, as prawcore's authorizer does"""
+        response = self.session.post(
+            urljoin(self.reddit_url, ACCESS_TOKEN_PATH),
+            auth=(self.client_id, self.client_secret),
+            data=sorted({'grant_type': 'refresh_token', 'refresh_token': self.refresh_token}.items()),
+            headers={'User-Agent': self.user_agent},
+            timeout=REQUEST_TIMEOUT,
+        )
+        response.raise_for_status()
+        payload = response.json()
+        self.access_token = payload['access_token']
+        self.expires_at = time.time() + payload['expires_in'] - EXPIRY_MARGIN
+
+    def request(self, method, path, params=None, data=None):
+        """
+        Send an authorized request, adding the parameters prawcore adds to every request
+
+        Args:
+            method (str): the http method
+            path (str): the path relative to the reddit url
+            params (dict): query parameters
+            data (dict): form data
+
+        Returns:
+            the decoded json response, or None for an empty response
+        """
+        if self.access_token is None or time.time() >= self.expires_at:
+            self.authorize()
+
+        params = dict(params or {}, raw_json=1)
+        if data is not None:
+            data = sorted(dict(data, api_type='json').items())
+        response = self.session.request(
+            method,
+            urljoin(self.reddit_url, path),
+            params=params,
+            data=data,
+            headers={
+                'Authorization': 'bearer {}'.format(self.access_token),
+                'User-Agent': self.user_agent,
+            },
+            timeout=REQUEST_TIMEOUT,
+        )
+        response.raise_for_status()
+        if not response.content:
+            return None
+        payload = response.json()
+        if isinstance(payload, dict) and payload.get('json', {}).get('errors'):
+            raise RedditAPIError(payload['json']['errors'])
+        return payload
+
+    def get(self, path, params=None):
+        """Send an authorized GET request"""
+        return self.request('GET', path, params=params)
+
+    def post(self, path, data=None):
+        """Send an authorized POST request"""
+        return self.request('POST', path, data=data or {})
+
+
+def _children(listing):
+    """
+    Returns:
+        list of dict: the data of the things in a listing
+    """
+    return [child['data'] for child in listing['data']['children']]
+
+
+def _things(payload):
+    """
+    Returns:
+        list of dict: the data of the things in a json api response
+    """
+    return [thing['data'] for thing in payload['json']['data']['things']]
+
+
+class RawApi:
+    """Channel API over raw reddit json, with the methods of channel_api.Api"""
+    def __init__(self, user, client_for):
+        """
+        Args:
+            user (User): the authenticated user
+            client_for (callable): returns the RawClient for a user
+        """
+        self.user = user
+        self.client_for = client_for
+        self.reddit = client_for(user)
+
+    def _api_for(self, username):
+        """
+        Returns:
+            RawApi: an api for another user, sharing the client lookup
+        """
+        return RawApi(User(username), self.client_for)
+
+    def list_channels(self):
+        """
+        List the channels the user subscribes to, the first LISTING_LIMIT of them like praw
+
+        Returns:
+            list of dict: the channels
+        """
+        channels = []
+        params = {'limit': LISTING_LIMIT}
+        while len(channels) < LISTING_LIMIT:
+            listing = self.reddit.get('subreddits/mine/subscriber', params=params)
+            channels.extend(_children(listing)[:LISTING_LIMIT - len(channels)])
+            after = listing['data']['after']
+            if after is None:
+                break
+            params = {'limit': LISTING_LIMIT, 'after': after}
+        return channels
+
+    def get_channel(self, name):
+        """
+        Get the channel
+
+        Returns:
+            dict: the specified channel
+        """
+        return self.reddit.get('r/{}/about/'.format(name))['data']
+
+    def load_channel(self, name):
+        """
+        Get the channel, fetching it
+
+        Returns:
+            dict: the specified channel
+        """
+        return self.get_channel(name)
+
+    def create_channel(self, name, title, channel_type='public', **other_settings):
+        """
+        Create a channel
+
+        Args:
+            name (str): name of the channel
+            title (str): title of the channel
+            channel_type (str): type of the channel
+            **other_settings (dict): dict of additional settings
+
+        Returns:
+            dict: the settings the channel was created with
+        """
+        values = {
+            'link_type': 'any',
+            'name': name,
+            'title': title or name,
+            'type': channel_type,
+            'wikimode': 'disabled',
+        }
+        values.update(other_settings)
+        self.reddit.post('api/site_admin/', data=values)
+        return values
+
+    def update_channel(self, name, title=None, channel_type=None, **other_settings):
+        """
+        Updates a channel
+
+        Args:
+            name (str): name of the channel
+            title (str): title of the channel
+            channel_type (str): type of the channel
+            **other_settings (dict): dict of additional settings
+
+        Returns:
+            dict: the updated settings of the channel
+        """
+        current = dict(self.reddit.get('r/{}/about/edit/'.format(name))['data'])
+        fullname = current.pop('subreddit_id')
+        for key, edit_key in EDIT_SETTINGS_REMAP.items():
+            current[key] = current.pop(edit_key, None)
+        current.update(other_settings)
+        if title is not None:
+            current['title'] = title
+        if channel_type is not None:
+            current['subreddit_type'] = channel_type
+        # praw posts subreddit_type as type, and leaves out the settings without a value
+        current['type'] = current.pop('subreddit_type', None)
+        current['sr'] = fullname
+        values = {key: value for key, value in current.items() if value is not None}
+        self.reddit.post('api/site_admin/', data=values)
+        return values
+
+    def create_post(self, channel_name, title, text=None, url=None):
+        """
+        Create a new post in a channel
+
+        Args:
+            channel_name(str): the channel name identifier
+            title(str): the title of the post
+            text(str): the text of the post
+            url(str): the url of the post
+
+        Raises:
+            ValueError: if both text and url are provided
+
+        Returns:
+            dict: the id, name and url of the submitted post
+        """
+        if len(list(filter(lambda val: val is not None, [text, url]))) != 1:
+            raise ValueError('Exactly one of text and url must be provided')
+        data = {
+            'sr': channel_name,
+            'resubmit': True,
+            'sendreplies': True,
+            'title': title,
+        }
+        if text is not None:
+            data.update(kind='self', text=text)
+        else:
+            data.update(kind='link', url=url)
+        return self.reddit.post('api/submit/', data=data)['json']['data']
+
+    def front_page(self, before=None, after=None, count=None):
+        """
+        List posts on front page using 'hot' algorithm
+
+        Returns:
+            list of dict: the posts
+        """
+        return _children(self.reddit.get('hot', params=_page_params(before, after, count)))
+
+    def list_posts(self, channel_name, before=None, after=None, count=None):
+        """
+        List posts using the 'hot' algorithm
+
+        Returns:
+            list of dict: the posts
+        """
+        return _children(self.reddit.get(
+            'r/{}/hot'.format(channel_name), params=_page_params(before, after, count)
+        ))
+
+    def _post_and_comments(self, post_id):
+        """
+        Returns:
+            (dict, dict): the post and its comment listing
+        """
+        post_listing, comment_listing = self.reddit.get(
+            'comments/{}/'.format(post_id), params={'limit': COMMENT_LIMIT, 'sort': COMMENT_SORT}
+        )
+        return _children(post_listing)[0], comment_listing
+
+    def get_post(self, post_id):
+        """
+        Gets the post
+
+        Args:
+            post_id(str): the base36 id for the post
+
+        Returns:
+            dict: the post
+        """
+        return self._post_and_comments(post_id)[0]
+
+    def load_post(self, post_id):
+        """
+        Gets the post, fetching it
+
+        Returns:
+            dict: the post
+        """
+        return self.get_post(post_id)
+
+    def get_post_likes(self, post_id):
+        """
+        Returns:
+            bool: True if the user upvoted the post, False if they downvoted it, None otherwise
+        """
+        return self.get_post(post_id)['likes']
+
+    def vote_post(self, post_id, direction):
+        """
+        Vote on a post
+
+        Args:
+            post_id(str): the base36 id for the post
+            direction(int): 1 to upvote, -1 to downvote, 0 to clear the vote
+        """
+        self._vote(POST_PREFIX + post_id, direction)
+
+    def update_post(self, post_id, text):
+        """
+        Updates the post
+
+        Raises:
+            ValueError: if the url post was provided
+
+        Returns:
+            dict: the updated post
+        """
+        post = self.get_post(post_id)
+
+        if not post['is_self']:
+            raise ValueError('Posts with a url cannot be updated')
+
+        return self._edit(POST_PREFIX + post_id, text)
+
+    def create_comment(self, text, post_id=None, comment_id=None):
+        """
+        Create a new comment in reply to a post or comment
+
+        Args:
+            text(str): the text of the comment
+            post_id(str): the parent post id if replying to a post
+            comment_id(str): the parent comment id if replying to a comment
+
+        Raises:
+            ValueError: if both post_id and comment_id are provided
+
+        Returns:
+            dict: the submitted comment
+        """
+        if len(list(filter(lambda val: val is not None, [post_id, comment_id]))) != 1:
+            raise ValueError('Exactly one of post_id and comment_id must be provided')
+
+        if post_id is not None:
+            parent = POST_PREFIX + post_id
+        else:
+            parent = COMMENT_PREFIX + comment_id
+        return _things(self.reddit.post('api/comment/', data={'text': text, 'thing_id': parent}))[0]
+
+    def update_comment(self, comment_id, text):
+        """
+        Updates a existing comment
+
+        Returns:
+            dict: the updated comment
+        """
+        return self._edit(COMMENT_PREFIX + comment_id, text)
+
+    def delete_comment(self, comment_id):
+        """
+        Deletes the comment
+        """
+        self.reddit.post('api/del/', data={'id': COMMENT_PREFIX + comment_id})
+
+    def get_comment(self, comment_id):
+        """
+        Gets the comment
+
+        Args:
+            comment_id(str): the base36 id for the comment
+
+        Returns:
+            dict: the comment
+        """
+        return _children(self.reddit.get('api/info/', params={'id': COMMENT_PREFIX + comment_id}))[0]
+
+    def get_comment_likes(self, comment_id):
+        """
+        Returns:
+            bool: True if the user upvoted the comment, False if they downvoted it, None otherwise
+        """
+        return self.get_comment(comment_id)['likes']
+
+    def vote_comment(self, comment_id, direction):
+        """
+        Vote on a comment
+
+        Args:
+            comment_id(str): the base36 id for the comment
+            direction(int): 1 to upvote, -1 to downvote, 0 to clear the vote
+        """
+        self._vote(COMMENT_PREFIX + comment_id, direction)
+
+    def list_comments(self, post_id):
+        """
+        Lists the comments of a post_id
+
+        Returns:
+            dict: the comment listing of the post
+        """
+        return self._post_and_comments(post_id)[1]
+
+    def load_comments(self, post_id):
+        """
+        Load the comments of a post, leaving its 'load more comments' stubs unexpanded
+
+        Returns:
+            FlatCommentTree: the comments of the post
+        """
+        tree = comments.new_tree(POST_PREFIX + post_id)
+        comments.add(tree, self.list_comments(post_id)['data']['children'], comments.describe_thing)
+        return tree
+
+    def load_more_comments(self, tree, stub):
+        """
+        Load the comments behind a 'load more comments' stub into a tree
+
+        Args:
+            tree (FlatCommentTree): the tree
+            stub (MoreStub): one of its stubs
+
+        Returns:
+            list of MoreStub: the stubs among the loaded comments
+        """
+        if stub.count == 0:
+            # a 'continue this thread' link loads the thread below the comment it hangs off
+            things = self.more_comments(tree.names[stub.parent], tree.post_fullname, 0)
+        else:
+            things = self.more_comments(stub.name, tree.post_fullname, stub.count, list(stub.children))
+        return comments.add(tree, things, comments.describe_thing)
+
+    def more_comments(self, comment_fullname, parent_fullname, count, children=None):
+        """
+        Fetches the comments behind a 'load more' stub
+
+        Args:
+            comment_fullname(str): the fullname for the comment
+            parent_fullname(str): the fullname of the post
+            count(int): the count of comments, 0 for a 'continue this thread' link
+            children(list(str)): the list of more comments (leave empty continue page links)
+
+        Returns:
+            list of dict: the comments and stubs, as reddit json things
+        """
+        if count != 0:
+            return self.reddit.post('api/morechildren/', data={
+                'children': ','.join(children or []),
+                'link_id': parent_fullname,
+                'sort': COMMENT_SORT,
+            })['json']['data']['things']
+
+        # the thread below the comment, starting with the comment itself
+        submission_id = parent_fullname.split('_', 1)[1]
+        comment_id = comment_fullname.split('_', 1)[1]
+        _, listing = self.reddit.get(
+            'comments/{}/_/{}'.format(submission_id, comment_id),
+            params={'limit': COMMENT_LIMIT, 'sort': COMMENT_SORT},
+        )
+        return listing['data']['children']
+
+    def add_contributor(self, contributor_name, channel_name):
+        """
+        Adds a user to the contributors of a channel
+
+        Returns:
+            dict: the user
+        """
+        self._friend(channel_name, contributor_name, 'contributor')
+        return {'name': contributor_name}
+
+    def remove_contributor(self, contributor_name, channel_name):
+        """
+        Removes a user from the contributors of a channel
+        """
+        self._unfriend(channel_name, contributor_name, 'contributor')
+
+    def list_contributors(self, channel_name):
+        """
+        Returns:
+            list of dict: the contributors in the channel
+        """
+        return _children(self.reddit.get(
+            'r/{}/about/contributors/'.format(channel_name), params={'limit': RELATIONSHIP_LIMIT}
+        ))
+
+    def add_moderator(self, moderator_name, channel_name):
+        """
+        Add a user to moderators for the channel
+
+        Returns:
+            dict: the user
+        """
+        moderators = self.list_moderators(channel_name)
+        if moderator_name not in (moderator['name'] for moderator in moderators):
+            self._friend(channel_name, moderator_name, 'moderator_invite', permissions='+all')
+            self._api_for(moderator_name).accept_invite(channel_name)
+        return {'name': moderator_name}
+
+    def accept_invite(self, channel_name):
+        """
+        Accept invitation as a subreddit moderator
+        """
+        self.reddit.post('r/{}/api/accept_moderator_invite'.format(channel_name))
+
+    def remove_moderator(self, moderator_name, channel_name):
+        """
+        Remove moderator from a channel
+        """
+        try:
+            self._unfriend(channel_name, moderator_name, 'moderator')
+        except HTTPError as ex:
+            # User is already not a moderator, see channel_api.Api.remove_moderator
+            if ex.response.status_code != 403:
+                raise
+
+    def list_moderators(self, channel_name):
+        """
+        Returns:
+            list of dict: the moderators of the channel
+        """
+        return _children(self.reddit.get('r/{}/about/moderators/'.format(channel_name)))
+
+    def add_subscriber(self, subscriber_name, channel_name):
+        """
+        Adds an user to the subscribers of a channel
+
+        Returns:
+            dict: the user
+        """
+        self._api_for(subscriber_name).reddit.post('api/subscribe/', data={
+            'action': 'sub',
+            'skip_initial_defaults': True,
+            'sr_name': channel_name,
+        })
+        return {'name': subscriber_name}
+
+    def remove_subscriber(self, subscriber_name, channel_name):
+        """
+        Removes an user from the subscribers of a channel
+        """
+        try:
+            self._api_for(subscriber_name).reddit.post('api/subscribe/', data={
+                'action': 'unsub',
+                'sr_name': channel_name,
+            })
+        except HTTPError as ex:
+            # User is already unsubscribed, see channel_api.Api.remove_subscriber
+            if ex.response.status_code != 404:
+                raise
+
+    def is_subscriber(self, subscriber_name, channel_name):
+        """
+        Returns:
+            bool: whether the user has subscribed to the channel
+        """
+        api = self._api_for(subscriber_name)
+        return channel_name in (channel['display_name'] for channel in api.list_channels())
+
+    def _vote(self, fullname, direction):
+        """Vote on a post or comment"""
+        self.reddit.post('api/vote/', data={'dir': str(direction), 'id': fullname})
+
+    def _edit(self, fullname, text):
+        """
+        Returns:
+            dict: the edited post or comment
+        """
+        return _things(self.reddit.post('api/editusertext/', data={'text': text, 'thing_id': fullname}))[0]
+
+    def _friend(self, channel_name, username, relationship, **other):
+        """Add a relationship between a user and a channel"""
+        data = {'name': username, 'type': relationship}
+        data.update(other)
+        self.reddit.post('r/{}/api/friend/'.format(channel_name), data=data)
+
+    def _unfriend(self, channel_name, username, relationship):
+        """Remove a relationship between a user and a channel"""
+        self.reddit.post('r/{}/api/unfriend/'.format(channel_name), data={
+            'name': username,
+            'type': relationship,
+        })
+
+
+def _page_params(before, after, count):
+    """
+    Returns:
+        dict: the query parameters of a 'hot' listing page
+    """
+    params = {'limit': settings.OPEN_DISCUSSIONS_CHANNEL_POST_LIMIT}
+    if before is not None:
+        params['before'] = before
+    if after is not None:
+        params['after'] = after
+    if count is not None:
+        params['count'] = count
+    return params
@@ -0,0 +1,92 @@
+"""
+Request names derived from request urls
+
+Every outgoing request is named after the route its url matches, with the ids in the url
+replaced by placeholders, so requests made deep inside praw are grouped without any help from
+the caller. All routes are compiled into one alternation, matched in a single pass. Listing
+pages past the first are named after a bucket of their page number.
+"""
+import re
+from urllib.parse import parse_qsl, urlsplit
+
+from open_discussions.channels.pagination import listing_page, page_bucket
+
+# (path regex, request name), tried in order, the first match wins
+ROUTES = (
+    # open-discussions REST API
+    (r"/api/v0/channels/[^/]+/posts/", "/api/v0/channels/[channel_name]/posts/"),
+    (r"/api/v0/channels/[^/]+/contributors/[^/]+/", "/api/v0/channels/[channel_name]/contributors/[username]/"),
+    (r"/api/v0/channels/[^/]+/contributors/", "/api/v0/channels/[channel_name]/contributors/"),
+    (r"/api/v0/channels/[^/]+/moderators/[^/]+/", "/api/v0/channels/[channel_name]/moderators/[username]/"),
+    (r"/api/v0/channels/[^/]+/moderators/", "/api/v0/channels/[channel_name]/moderators/"),
+    (r"/api/v0/channels/[^/]+/subscribers/[^/]+/", "/api/v0/channels/[channel_name]/subscribers/[username]/"),
+    (r"/api/v0/channels/[^/]+/subscribers/", "/api/v0/channels/[channel_name]/subscribers/"),
+    (r"/api/v0/channels/[^/]+/", "/api/v0/channels/[channel_name]/"),
+    (r"/api/v0/posts/[^/]+/comments/", "/api/v0/posts/[post_id]/comments/"),
+    (r"/api/v0/posts/[^/]+/", "/api/v0/posts/[post_id]/"),
+    (r"/api/v0/comments/[^/]+/", "/api/v0/comments/[comment_id]/"),
+    (r"/api/v0/users/[^/]+/", "/api/v0/users/[username]/"),
+    (r"/api/v0/profiles/[^/]+/", "/api/v0/profiles/[username]/"),
+    (r"/api/v0/(?P<v0>[a-z_]+)/?", "/api/v0/{v0}/"),
+    # reddit, per subreddit
+    (r"/r/[^/]+/(?P<listing>hot|new|top|controversial)/?", "/r/[channel_name]/{listing}"),
+    (r"/r/[^/]+/about/(?P<about>moderators|contributors|edit)/?", "/r/[channel_name]/about/{about}/"),
+    (r"/r/[^/]+/about/?", "/r/[channel_name]/about/"),
+    (r"/r/[^/]+/api/(?P<action>[a-z_]+)/?", "/r/[channel_name]/api/{action}/"),
+    # reddit, comments and listings
+    (r"/comments/[^/]+/_/[^/]+/?", "/comments/[post_id]/_/[comment_id]/"),
+    (r"/comments/[^/]+(?:/[^/]*)?/?", "/comments/[post_id]/"),
+    (r"/(?P<front>hot|new|top|controversial)/?", "/{front}"),
+    (r"/subreddits/mine/(?P<where>[a-z]+)/?", "/subreddits/mine/{where}"),
+    (r"/user/[^/]+/about/?", "/user/[username]/about/"),
+    # reddit api, no ids in these paths
+    (r"/api/v1/(?P<v1>[a-z_]+)/?", "/api/v1/{v1}"),
+    (r"/api/(?P<api>[a-z_]+)/?", "/api/{api}/"),
+)
+
+# routes of listings paged through with after and count
+LISTING_ROUTES = frozenset(("/r/[channel_name]/{listing}", "/{front}"))
+# reddit's page size when a listing request doesn't give a limit
+DEFAULT_LISTING_LIMIT = 25
+
+_PATTERN = re.compile("|".join(
+    "(?P<route{}>{})".format(index, re.sub(r"\(\?P<(\w+)>", r"(?P<route{}_\1>".format(index), regex))
+    for index, (regex, _) in enumerate(ROUTES)
+))
+# segments with a digit in them are most likely ids
+_ID_SEGMENT = re.compile(r"/[^/]*\d[^/]*")
+
+
+def route_name(url, query_params=None):
+    """
+    Name a request after the route its url matches
+
+    Args:
+        url (str): the absolute or relative request url
+        query_params (dict): the query parameters sent besides any in the url
+
+    Returns:
+        str: the request name, without the query string
+    """
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    match = _PATTERN.fullmatch(path)
+    if match is None:
+        return _ID_SEGMENT.sub("/[id]", path)
+
+    index = int(match.lastgroup[len("route"):])
+    prefix = "route{}_".format(index)
+    params = {
+        group[len(prefix):]: value
+        for group, value in match.groupdict().items()
+        if group.startswith(prefix) and value is not None
+    }
+    template = ROUTES[index][1]
+    name = template.format(**params)
+    if template in LISTING_ROUTES:
+        query = dict(parse_qsl(parts.query))
+        query.update(query_params or {})
+        page = listing_page(query, DEFAULT_LISTING_LIMIT)
+        if page > 1:
+            name = "{} [page={}]".format(name, page_bucket(page))
+    return name
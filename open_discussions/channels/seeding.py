@@ -0,0 +1,418 @@
+"""
+Seeding the data the read-only test reads, once per cluster
+
+The first simulated user of a worker seeds that worker's share of the data, with at most
+OPEN_DISCUSSIONS_SEED_CONCURRENCY requests in flight, while the other users wait for it. Each
+worker creates its share of the users, channels, posts and comments, by LOCUST_WORKER_INDEX out
+of LOCUST_WORKER_COUNT, so the cluster as a whole seeds the configured amounts once. Reading
+starts once the newest posts show up in their listings.
+
+With OPEN_DISCUSSIONS_SEED_MANIFEST set, the seeded names and ids are written to a JSON lines
+manifest, one per worker when there are several. Later runs against the same server read the
+manifest back instead of seeding, as long as a sample of its channels and posts still exist.
+Workers sharing the manifests' directory also read the manifests of the other workers, so every
+worker reads the data of the whole cluster, each shard with its own users since the channels are
+private to the users seeded with them. Otherwise a worker only reads the data it seeded.
+"""
+from collections import namedtuple
+import json
+import logging
+import os
+import random
+import time
+
+import gevent
+from gevent.pool import Pool
+from faker import Faker
+
+from open_discussions.channels import sessions
+from open_discussions.channels import settings
+
+log = logging.getLogger(__name__)
+fake = Faker()
+
+# every seeded user contributes to every channel of its share, the posts and comments are
+# (channel name, id) pairs
+SeedData = namedtuple('SeedData', ['usernames', 'channels', 'posts', 'comments'])
+
+# seconds between two checks that the seeded posts are listed, or the other shards are seeded
+SETTLE_POLL_SECONDS = 1
+MANIFEST_VERSION = 2
+
+_SEEDING = None
+
+
+def shard(total, index, count):
+    """
+    Args:
+        total (int): the number of items for the whole cluster
+        index (int): the 0-based index of the worker
+        count (int): the number of workers
+
+    Returns:
+        int: the number of items the worker creates
+    """
+    return total // count + (1 if index < total % count else 0)
+
+
+class Seeder:
+    """Creates the seed data through a bounded pool of greenlets"""
+    def __init__(self, api, concurrency):
+        """
+        Args:
+            api (OpenDiscussionsApi): a staff api client
+            concurrency (int): the most requests in flight
+        """
+        self.api = api
+        self.pool = Pool(concurrency)
+
+    def _map(self, func, items):
+        """
+        Returns:
+            list: the results of func over items that aren't None, in completion order
+        """
+        return [result for result in self.pool.imap_unordered(func, items) if result is not None]
+
+    def create_user(self, _):
+        """
+        Returns:
+            str: the username, or None if the user could not be created
+        """
+        res = self.api.users.create(name=fake.name(), image=None, image_small=None, image_medium=None)
+        if res.status_code != 201:
+            return None
+        return res.json()['username']
+
+    def create_channel(self, _):
+        """
+        Returns:
+            str: the channel name, or None if the channel could not be created
+        """
+        name = '_'.join(fake.paragraph().split(' ')[:2]).lower()
+        res = self.api.channels.create(
+            title=' '.join(fake.paragraph().split(' ')[:2]),
+            name=name,
+            public_description=fake.paragraph(),
+            channel_type='private',
+        )
+        if res.status_code != 201:
+            return None
+        return name
+
+    def add_contributor(self, membership):
+        """Adds a user to a channel as a contributor and subscriber"""
+        channel, username = membership
+        self.api.channels.add_contributor(channel, username)
+        self.api.channels.add_subscriber(channel, username)
+
+    def create_post(self, author):
+        """
+        Args:
+            author ((str, str)): the channel name and the username posting to it
+
+        Returns:
+            (str, str): the channel name and the post id, or None if the post could not be created
+        """
+        channel, username = author
+        res = sessions.CACHE.get(username).post(
+            '/api/v0/channels/{}/posts/'.format(channel),
+            json={
+                'title': ' '.join(fake.paragraph().split(' ')[:2]),
+                'text': fake.paragraph(),
+                'upvoted': False,
+            },
+            name='/api/v0/channels/[channel_name]/posts/'
+        )
+        if res.status_code != 201:
+            return None
+        return channel, res.json()['id']
+
+    def create_comment(self, author):
+        """
+        Args:
+            author (((str, str), str)): the channel name and id of the post, and the username
+                commenting on it
+
+        Returns:
+            (str, str): the channel name and the comment id, or None if the comment could not be created
+        """
+        (channel, post_id), username = author
+        res = sessions.CACHE.get(username).post(
+            '/api/v0/posts/{}/comments/'.format(post_id),
+            json={"text": fake.paragraph()},
+            name='/api/v0/posts/[post_id]/comments/'
+        )
+        if res.status_code != 201:
+            return None
+        return channel, res.json()['id']
+
+    def seed(self, users, channels, posts_per_channel, comments_per_post):
+        """
+        Create the data, each kind once the kinds it depends on exist
+
+        Args:
+            users (int): the users to create
+            channels (int): the channels to create
+            posts_per_channel (int): the posts created in each channel
+            comments_per_post (int): the comments created on each post
+
+        Returns:
+            SeedData: the names and ids created
+        """
+        usernames = self._map(self.create_user, range(users))
+        channel_names = self._map(self.create_channel, range(channels))
+        self._map(self.add_contributor, [
+            (channel, username) for channel in channel_names for username in usernames
+        ])
+        if not usernames:
+            return SeedData(usernames, channel_names, [], [])
+
+        posts = self._map(self.create_post, [
+            (channel, random.choice(usernames))
+            for channel in channel_names for _ in range(posts_per_channel)
+        ])
+        comments = self._map(self.create_comment, [
+            (post, random.choice(usernames))
+            for post in posts for _ in range(comments_per_post)
+        ])
+        return SeedData(usernames, channel_names, posts, comments)
+
+
+def settle(data, timeout):
+    """
+    Wait until a seeded channel lists its posts, or the timeout passes
+
+    Args:
+        data (SeedData): the seeded data
+        timeout (int): the most seconds to wait
+    """
+    if not data.posts:
+        return
+    client = sessions.CACHE.get(data.usernames[0])
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        res = client.get(
+            '/api/v0/channels/{}/posts/'.format(data.posts[-1][0]),
+            name='/api/v0/channels/[channel_name]/posts/ [settle]',
+        )
+        if res.status_code == 200 and res.json().get('posts'):
+            return
+        gevent.sleep(SETTLE_POLL_SECONDS)
+    log.warning("Seeded posts were not listed after %s seconds, reading anyway", timeout)
+
+
+def manifest_path(index=None):
+    """
+    Args:
+        index (int): the worker, this worker by default
+
+    Returns:
+        str: the manifest of the worker, or None if seeding isn't recorded
+    """
+    path = settings.OPEN_DISCUSSIONS_SEED_MANIFEST
+    if not path:
+        return None
+    if settings.LOCUST_WORKER_COUNT == 1:
+        return path
+    if index is None:
+        index = settings.LOCUST_WORKER_INDEX
+    root, ext = os.path.splitext(path)
+    return '{}.{}-of-{}{}'.format(root, index, settings.LOCUST_WORKER_COUNT, ext)
+
+
+def write_manifest(path, data):
+    """
+    Write seeded data as JSON lines, a header then the names or ids of each kind
+
+    Args:
+        path (str): the manifest
+        data (SeedData): the seeded data
+    """
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as manifest:
+        manifest.write(json.dumps({
+            'version': MANIFEST_VERSION,
+            'base_url': settings.OPEN_DISCUSSIONS_BASE_URL,
+            'created': int(time.time()),
+        }) + '\n')
+        for kind in SeedData._fields:
+            manifest.write(json.dumps({'kind': kind, 'ids': getattr(data, kind)}) + '\n')
+    os.replace(tmp_path, path)
+
+
+def read_manifest(path):
+    """
+    Args:
+        path (str): the manifest
+
+    Returns:
+        SeedData: the data recorded, or None if there is no usable manifest for this server
+    """
+    try:
+        with open(path) as manifest:
+            header = json.loads(next(manifest))
+            ids = {}
+            for line in manifest:
+                entry = json.loads(line)
+                ids[entry['kind']] = entry['ids']
+    except (OSError, StopIteration, ValueError, KeyError) as ex:
+        log.info("No usable seed manifest at %s: %s", path, ex)
+        return None
+
+    if header.get('version') != MANIFEST_VERSION or header.get('base_url') != settings.OPEN_DISCUSSIONS_BASE_URL:
+        log.info("Seed manifest %s was written for another version or server", path)
+        return None
+    if any(kind not in ids for kind in SeedData._fields):
+        log.info("Seed manifest %s is incomplete", path)
+        return None
+    return SeedData(**ids)
+
+
+def verify(data, sample_size):
+    """
+    Check a sample of the seeded channels and posts still exist
+
+    Args:
+        data (SeedData): the data read from a manifest
+        sample_size (int): the most channels and posts checked
+
+    Returns:
+        bool: True if every sampled channel and post was found
+    """
+    if not data.usernames or not data.channels:
+        return False
+    client = sessions.CACHE.get(random.choice(data.usernames))
+    checks = [
+        ('/api/v0/channels/{}/'.format(channel), '/api/v0/channels/[channel_name]/ [verify]')
+        for channel in random.sample(data.channels, min(sample_size, len(data.channels)))
+    ] + [
+        ('/api/v0/posts/{}/'.format(post_id), '/api/v0/posts/[post_id]/ [verify]')
+        for _, post_id in random.sample(data.posts, min(sample_size, len(data.posts)))
+    ]
+    for url, name in checks:
+        if client.get(url, name=name).status_code != 200:
+            log.warning("%s from the seed manifest is gone", url)
+            return False
+    return True
+
+
+def _load_manifest(index=None):
+    """
+    Args:
+        index (int): the worker, this worker by default
+
+    Returns:
+        SeedData: the verified data of the worker's manifest, or None
+    """
+    path = manifest_path(index)
+    if path is None:
+        return None
+    data = read_manifest(path)
+    if data is None or not verify(data, settings.OPEN_DISCUSSIONS_SEED_MANIFEST_SAMPLE):
+        return None
+    log.info(
+        "Reading %s users, %s channels, %s posts and %s comments from %s",
+        len(data.usernames), len(data.channels), len(data.posts), len(data.comments), path,
+    )
+    return data
+
+
+def other_shards(timeout):
+    """
+    Wait for the manifests of the other workers, as they finish seeding
+
+    Args:
+        timeout (int): the most seconds to wait for them
+
+    Returns:
+        list of SeedData: the data seeded by the other workers, those found before the timeout
+    """
+    if manifest_path() is None:
+        return []
+    missing = set(range(settings.LOCUST_WORKER_COUNT)) - {settings.LOCUST_WORKER_INDEX}
+    shards = []
+    deadline = time.monotonic() + timeout
+    while missing:
+        for index in sorted(missing):
+            data = _load_manifest(index)
+            if data is not None:
+                missing.discard(index)
+                shards.append(data)
+        if not missing or time.monotonic() >= deadline:
+            break
+        gevent.sleep(SETTLE_POLL_SECONDS)
+    if missing:
+        log.warning(
+            "No manifest from workers %s after %s seconds, reading without their data",
+            ", ".join(str(index) for index in sorted(missing)), timeout,
+        )
+    return shards
+
+
+def _seed_shard(api):
+    """
+    Seed this worker's share of the data, unless its manifest can be reused
+
+    Returns:
+        SeedData: the names and ids created
+    """
+    data = _load_manifest()
+    if data is not None:
+        return data
+
+    index, count = settings.LOCUST_WORKER_INDEX, settings.LOCUST_WORKER_COUNT
+    seeder = Seeder(api, settings.OPEN_DISCUSSIONS_SEED_CONCURRENCY)
+    data = seeder.seed(
+        shard(settings.USERS_TO_CREATE, index, count),
+        shard(settings.CHANNELS_TO_CREATE, index, count),
+        settings.POSTS_PER_CHANNEL,
+        settings.COMMENTS_PER_POST,
+    )
+    log.info(
+        "Worker %s of %s seeded %s users, %s channels, %s posts and %s comments",
+        index, count, len(data.usernames), len(data.channels), len(data.posts), len(data.comments),
+    )
+    if not data.posts:
+        log.warning(
+            "Worker %s of %s seeded no posts, there are more workers than channels to seed",
+            index, count,
+        )
+    path = manifest_path()
+    if path is not None:
+        write_manifest(path, data)
+    settle(data, settings.WAIT_BEFORE_LOAD_TEST_SECONDS)
+    return data
+
+
+def _seed_cluster(api):
+    """
+    Returns:
+        list of SeedData: the data of every shard found, this worker's first
+    """
+    return [_seed_shard(api)] + other_shards(settings.OPEN_DISCUSSIONS_SEED_SHARD_WAIT_SECONDS)
+
+
+def seed_once(api):
+    """
+    Seed the data, or read it from the manifest, on the first call, every call waits for it
+
+    If seeding fails the next call starts over.
+
+    Args:
+        api (OpenDiscussionsApi): a staff api client, used by the call seeding
+
+    Returns:
+        list of SeedData: the data of every shard found, this worker's first
+    """
+    global _SEEDING  # pylint: disable=global-statement
+    if _SEEDING is None:
+        _SEEDING = gevent.spawn(_seed_cluster, api)
+    seeding = _SEEDING
+    try:
+        return seeding.get()
+    except Exception:
+        # only the first of the users waiting on it reports the failure
+        if _SEEDING is seeding:
+            log.exception("Seeding failed, the next user to start will try again")
+            _SEEDING = None
+        raise
@@ -0,0 +1,138 @@
+"""
+Authenticated open-discussions sessions cached per username
+
+OpenDiscussionsApi signs a new JWT every time it authenticates a session, and the tests used to
+authenticate one for every task. The cache keeps a locust session per username instead, signed
+once and kept until shortly before its token expires, so requests for the same user reuse both
+the token and the session's open connections. The least recently used sessions are closed once
+OPEN_DISCUSSIONS_SESSION_CACHE_SIZE users have one; 0 goes back to authenticating the shared
+locust client on every call.
+"""
+import base64
+import json
+import time
+
+from locust.clients import HttpSession
+from open_discussions_api.client import OpenDiscussionsApi
+
+from open_discussions.channels import settings
+from open_discussions.util import reporting
+from open_discussions.util.cache import LRUCache
+
+# sign a new token this many seconds before the current one expires
+EXPIRY_MARGIN = 30
+
+
+def token_expiry(session):
+    """
+    Read the expiry of the JWT a session authenticates with, without verifying it
+
+    Args:
+        session (requests.Session): an authenticated session
+
+    Returns:
+        float: the expiry as a unix timestamp, or None if the token has none
+    """
+    try:
+        token = session.headers["Authorization"].split()[-1]
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def _pool_counts(session):
+    """
+    Returns:
+        (int, int): the connections a session opened and the requests it sent over them
+    """
+    connections = requests = 0
+    for adapter in session.adapters.values():
+        poolmanager = getattr(adapter, "poolmanager", None)
+        if poolmanager is None:
+            continue
+        for key in poolmanager.pools.keys():
+            pool = poolmanager.pools[key]
+            connections += pool.num_connections
+            requests += pool.num_requests
+    return connections, requests
+
+
+class SessionCache:
+    """Authenticated sessions by username"""
+    def __init__(self, maxsize, base_url, secret):
+        """
+        Args:
+            maxsize (int): the most sessions kept open, 0 disables the cache
+            base_url (str): the open-discussions url
+            secret (str): the JWT secret
+        """
+        self.base_url = base_url
+        self.secret = secret
+        self.sessions = LRUCache(
+            maxsize, ttl=settings.OPEN_DISCUSSIONS_SESSION_CACHE_TTL, on_evict=self._close
+        )
+        self.built = 0
+        # connection counts of the sessions already closed
+        self.closed_connections = 0
+        self.closed_requests = 0
+
+    def get(self, username):
+        """
+        Args:
+            username (str): the user
+
+        Returns:
+            requests.Session: a session authenticated as the user
+        """
+        if self.sessions.maxsize == 0:
+            api = OpenDiscussionsApi(self.secret, self.base_url, username)
+            return api._get_authenticated_session()  # pylint: disable=protected-access
+
+        session = self.sessions.get(username)
+        if session is None:
+            api = OpenDiscussionsApi(self.secret, self.base_url, username)
+            session = HttpSession(self.base_url)
+            # authenticate the user's own session rather than the shared locust client
+            api._get_session = lambda: session  # pylint: disable=protected-access
+            api._get_authenticated_session()  # pylint: disable=protected-access
+            self.built += 1
+
+            expiry = token_expiry(session)
+            ttl = expiry - time.time() - EXPIRY_MARGIN if expiry is not None else None
+            self.sessions.put(username, session, ttl=ttl)
+        return session
+
+    def _close(self, session):
+        """Close an evicted or expired session, keeping its connection counts"""
+        connections, requests = _pool_counts(session)
+        self.closed_connections += connections
+        self.closed_requests += requests
+        session.close()
+
+    def stats(self):
+        """
+        Returns:
+            dict: the cache counters, and how many requests reused an open connection
+        """
+        connections, requests = self.closed_connections, self.closed_requests
+        for session in self.sessions.values():
+            session_connections, session_requests = _pool_counts(session)
+            connections += session_connections
+            requests += session_requests
+        return dict(
+            self.sessions.stats(),
+            built=self.built,
+            connections=connections,
+            requests=requests,
+            reused_connections=requests - connections,
+        )
+
+
+CACHE = SessionCache(
+    settings.OPEN_DISCUSSIONS_SESSION_CACHE_SIZE,
+    settings.OPEN_DISCUSSIONS_BASE_URL,
+    settings.OPEN_DISCUSSIONS_JWT_SECRET,
+)
+reporting.register("od_sessions", CACHE.stats)
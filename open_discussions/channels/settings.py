@@ -15,17 +15,28 @@ def get_var(name, default=None):
 # locust settings
 LOCUST_TASK_MIN_WAIT = int(get_var('LOCUST_TASK_MIN_WAIT', 500))
 LOCUST_TASK_MAX_WAIT = int(get_var('LOCUST_TASK_MAX_WAIT', 1500))
+# which worker of how many this process is, set per worker to split the seeding between them
+LOCUST_WORKER_INDEX = int(get_var('LOCUST_WORKER_INDEX', 0))
+LOCUST_WORKER_COUNT = int(get_var('LOCUST_WORKER_COUNT', 1))
 
 OPEN_DISCUSSIONS_JWT_SECRET = get_var('OPEN_DISCUSSIONS_JWT_SECRET', 'terribly_unsafe_default_jwt_secret_key')
 OPEN_DISCUSSIONS_BASE_URL = get_var('OPEN_DISCUSSIONS_BASE_URL', 'http://mit-open.mit.local:8063')
 OPEN_DISCUSSIONS_API_USERNAME = get_var('OPEN_DISCUSSIONS_API_USERNAME', 'mitodl')
 
-POST_WAIT_SECONDS = int(get_var('OPEN_DISCUSSIONS_POST_WAIT_SECONDS', 0.5))
+# the most seconds to wait for the seeded posts to be listed before reading
 WAIT_BEFORE_LOAD_TEST_SECONDS = int(get_var('OPEN_DISCUSSIONS_WAIT_BEFORE_LOAD_TEST_SECONDS', 10))
 USERS_TO_CREATE = int(get_var('OPEN_DISCUSSIONS_USERS_TO_CREATE', 15))
 CHANNELS_TO_CREATE = int(get_var('OPEN_DISCUSSIONS_CHANNELS_TO_CREATE', 4))
 POSTS_PER_CHANNEL = int(get_var('OPEN_DISCUSSIONS_POSTS_PER_CHANNEL', 10))
 COMMENTS_PER_POST = int(get_var('OPEN_DISCUSSIONS_POSTS_PER_CHANNEL', 20))
+# seeding requests in flight at once
+OPEN_DISCUSSIONS_SEED_CONCURRENCY = int(get_var('OPEN_DISCUSSIONS_SEED_CONCURRENCY', 16))
+# the most seconds to wait for the other workers' manifests, to read their data too
+OPEN_DISCUSSIONS_SEED_SHARD_WAIT_SECONDS = int(get_var('OPEN_DISCUSSIONS_SEED_SHARD_WAIT_SECONDS', 600))
+# manifest of the seeded data, reused by later runs against the same server, empty to always seed
+OPEN_DISCUSSIONS_SEED_MANIFEST = get_var('OPEN_DISCUSSIONS_SEED_MANIFEST', '')
+# channels and posts of a manifest checked to still exist before reusing it
+OPEN_DISCUSSIONS_SEED_MANIFEST_SAMPLE = int(get_var('OPEN_DISCUSSIONS_SEED_MANIFEST_SAMPLE', 5))
 
 OPEN_DISCUSSIONS_REDDIT_CLIENT_ID = get_var('OPEN_DISCUSSIONS_REDDIT_CLIENT_ID')
 OPEN_DISCUSSIONS_REDDIT_SECRET = get_var('OPEN_DISCUSSIONS_REDDIT_SECRET')
@@ -34,6 +45,67 @@ OPEN_DISCUSSIONS_REDDIT_URL = get_var('OPEN_DISCUSSIONS_REDDIT_URL')
 
 OPEN_DISCUSSIONS_CHANNEL_POST_LIMIT = int(get_var('OPEN_DISCUSSIONS_CHANNEL_POST_LIMIT', 25))
 
+# refresh tokens are cached per username and process, 0 disables the cache
+OPEN_DISCUSSIONS_REDDIT_TOKEN_CACHE_SIZE = int(get_var('OPEN_DISCUSSIONS_REDDIT_TOKEN_CACHE_SIZE', 1000))
+OPEN_DISCUSSIONS_REDDIT_TOKEN_CACHE_TTL = int(get_var('OPEN_DISCUSSIONS_REDDIT_TOKEN_CACHE_TTL', 3600))
+# request a new refresh token for every client built, as every client used to
+OPEN_DISCUSSIONS_REDDIT_TOKEN_PER_CLIENT = get_var('OPEN_DISCUSSIONS_REDDIT_TOKEN_PER_CLIENT', 'false').lower() == 'true'
+# path of the SQLite refresh token store shared by the processes on a host, empty to disable
+OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT = get_var('OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT', '')
+# seconds between writes of the refresh tokens requested during the run to the vault
+OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT_FLUSH_SECONDS = \
+    int(get_var('OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT_FLUSH_SECONDS', 10))
+# praw clients are pooled per username and process, 0 disables the pool
+OPEN_DISCUSSIONS_REDDIT_CLIENT_POOL_SIZE = int(get_var('OPEN_DISCUSSIONS_REDDIT_CLIENT_POOL_SIZE', 500))
+# pooled clients unused for this many seconds are dropped
+OPEN_DISCUSSIONS_REDDIT_CLIENT_POOL_IDLE_SECONDS = int(get_var('OPEN_DISCUSSIONS_REDDIT_CLIENT_POOL_IDLE_SECONDS', 600))
+# weight of the task deliberately requesting refresh tokens, to load test the token endpoint itself
+OPEN_DISCUSSIONS_REDDIT_TOKEN_TASK_WEIGHT = int(get_var('OPEN_DISCUSSIONS_REDDIT_TOKEN_TASK_WEIGHT', 5))
+# praw builds models for every response, raw speaks reddit's json directly, see channels/raw_api.py
+OPEN_DISCUSSIONS_REDDIT_BACKEND = get_var('OPEN_DISCUSSIONS_REDDIT_BACKEND', 'praw')
+# let praw sleep on reddit's ratelimit headers and retry failures, false to report throttling instead
+OPEN_DISCUSSIONS_REDDIT_CLIENT_THROTTLING = \
+    get_var('OPEN_DISCUSSIONS_REDDIT_CLIENT_THROTTLING', 'true').lower() == 'true'
+# 'load more comments' stubs expanded per post whose comments are loaded, 0 expands none
+OPEN_DISCUSSIONS_REDDIT_MORE_COMMENTS_LIMIT = int(get_var('OPEN_DISCUSSIONS_REDDIT_MORE_COMMENTS_LIMIT', 0))
+# stubs loaded at once
+OPEN_DISCUSSIONS_REDDIT_MORE_COMMENTS_CONCURRENCY = int(get_var('OPEN_DISCUSSIONS_REDDIT_MORE_COMMENTS_CONCURRENCY', 4))
+# skip stubs with fewer comments behind them, 0 also expands 'continue this thread' links
+OPEN_DISCUSSIONS_REDDIT_MORE_COMMENTS_MIN_CHILDREN = int(get_var('OPEN_DISCUSSIONS_REDDIT_MORE_COMMENTS_MIN_CHILDREN', 1))
+
+# comment threads built for the thread size scaling tasks, as depth:branching:size triples
+OPEN_DISCUSSIONS_THREAD_SHAPES = get_var('OPEN_DISCUSSIONS_THREAD_SHAPES', '1:20:20,3:4:80,6:2:120,4:5:400')
+# comments created at once while building a thread
+OPEN_DISCUSSIONS_THREAD_CONCURRENCY = int(get_var('OPEN_DISCUSSIONS_THREAD_CONCURRENCY', 8))
+# weights of the tasks building threads and loading them, 0 leaves the tasks out
+OPEN_DISCUSSIONS_THREAD_CREATE_WEIGHT = int(get_var('OPEN_DISCUSSIONS_THREAD_CREATE_WEIGHT', 0))
+OPEN_DISCUSSIONS_THREAD_LOAD_WEIGHT = int(get_var('OPEN_DISCUSSIONS_THREAD_LOAD_WEIGHT', 0))
+
+# how many pages deep the pagination tasks read listings, as pages:weight pairs
+OPEN_DISCUSSIONS_PAGINATION_DEPTHS = get_var('OPEN_DISCUSSIONS_PAGINATION_DEPTHS', '1:50,2:25,4:15,8:10')
+# weight of each pagination task, 0 leaves them out
+OPEN_DISCUSSIONS_PAGINATION_WEIGHT = int(get_var('OPEN_DISCUSSIONS_PAGINATION_WEIGHT', 0))
+
+# read the current vote before voting, or go by the last vote this process cast
+OPEN_DISCUSSIONS_VOTE_READ_BEFORE = get_var('OPEN_DISCUSSIONS_VOTE_READ_BEFORE', 'true').lower() == 'true'
+# read the vote back after voting
+OPEN_DISCUSSIONS_VOTE_READ_AFTER = get_var('OPEN_DISCUSSIONS_VOTE_READ_AFTER', 'true').lower() == 'true'
+# votes remembered per process for voting without reading first
+OPEN_DISCUSSIONS_VOTE_STATE_SIZE = int(get_var('OPEN_DISCUSSIONS_VOTE_STATE_SIZE', 100000))
+
+# check the requests each task sends against the ones it declares, see channels/audit.py
+OPEN_DISCUSSIONS_TASK_AUDIT = get_var('OPEN_DISCUSSIONS_TASK_AUDIT', 'false').lower() == 'true'
+# read praw's lazy listings right away, so a task can't skip their requests by not iterating them
+OPEN_DISCUSSIONS_MATERIALIZE_LISTINGS = get_var('OPEN_DISCUSSIONS_MATERIALIZE_LISTINGS', 'false').lower() == 'true'
+
+# authenticated open-discussions sessions kept per process, 0 authenticates a session for every request
+OPEN_DISCUSSIONS_SESSION_CACHE_SIZE = int(get_var('OPEN_DISCUSSIONS_SESSION_CACHE_SIZE', 1000))
+# seconds a session is kept when its token doesn't say when it expires
+OPEN_DISCUSSIONS_SESSION_CACHE_TTL = int(get_var('OPEN_DISCUSSIONS_SESSION_CACHE_TTL', 600))
+
+# entities of each kind the channel tests keep per process to pick from, past that they are sampled
+OPEN_DISCUSSIONS_ENTITY_REGISTRY_SIZE = int(get_var('OPEN_DISCUSSIONS_ENTITY_REGISTRY_SIZE', 10000))
+
 
 # base settings to start a base django app
 SECRET_KEY = 'fake'
@@ -0,0 +1,68 @@
+"""
+Comment threads of a chosen shape, for measuring how comment loading scales with thread size
+
+A shape is a depth, a branching factor and a size. The post gets `branching` top-level comments
+and every comment `branching` replies, level by level, until the thread has `size` comments;
+`depth` levels must be enough to reach it. The replies of a level are created concurrently.
+"""
+from collections import namedtuple
+
+from gevent.pool import Pool
+
+ThreadShape = namedtuple('ThreadShape', ['depth', 'branching', 'size'])
+
+
+def parse_shapes(value):
+    """
+    Args:
+        value (str): comma separated depth:branching:size triples, like "1:20:20,4:3:100"
+
+    Returns:
+        list of ThreadShape: the shapes
+    """
+    shapes = []
+    for triple in value.split(','):
+        depth, branching, size = (int(part) for part in triple.split(':'))
+        if depth < 1 or branching < 1 or size < 1:
+            raise ValueError('Invalid thread shape {}'.format(triple))
+        if sum(branching ** level for level in range(1, depth + 1)) < size:
+            raise ValueError('Thread shape {} is too shallow to reach {} comments'.format(triple, size))
+        shapes.append(ThreadShape(depth, branching, size))
+    return shapes
+
+
+def size_tag(comment_count):
+    """
+    Args:
+        comment_count (int): the number of comments of the thread, as created by build_thread
+
+    Returns:
+        str: the suffix naming requests for a thread of this size
+    """
+    return ' [comments={}]'.format(comment_count)
+
+
+def build_thread(reply, shape, concurrency):
+    """
+    Build a thread of the given shape, breadth first
+
+    Args:
+        reply (callable): takes the id of the comment to reply to, or None to reply to the post,
+            and returns the id of the new comment, or None if it could not be created
+        shape (ThreadShape): the shape of the thread
+        concurrency (int): the most comments created at once
+
+    Returns:
+        list of str: the ids of the comments created, level by level
+    """
+    pool = Pool(concurrency)
+    created = []
+    parents = [None]
+    for _ in range(shape.depth):
+        remaining = shape.size - len(created)
+        if remaining <= 0 or not parents:
+            break
+        replies_to = [parent for parent in parents for _ in range(shape.branching)][:remaining]
+        parents = [comment_id for comment_id in pool.imap(reply, replies_to) if comment_id is not None]
+        created.extend(parents)
+    return created
@@ -0,0 +1,104 @@
+"""
+Throttling signalled by reddit, recorded as its own metric
+
+By default prawcore reads reddit's x-ratelimit headers and sleeps to respect them, and retries
+some failed requests on its own, so throttling ends up as slower tasks. With
+OPEN_DISCUSSIONS_REDDIT_CLIENT_THROTTLING=false the praw clients get a pass-through rate limiter
+and a single attempt per request instead (a second one only to refresh an expired access token),
+and every throttling signal is counted below, with the seconds reddit asked to wait and the
+requests throttled per route. They are client counters rather than locust requests, so they
+don't inflate the request counts and RPS.
+"""
+from prawcore.exceptions import ResponseException
+
+from open_discussions.util import reporting
+
+TOO_MANY_REQUESTS = 429
+UNAUTHORIZED = 401
+
+STATS = {
+    "too_many_requests": 0,
+    "ratelimit_exhausted": 0,
+    "responses_with_ratelimit": 0,
+    # the total of the waits reddit asked for
+    "requested_wait_seconds": 0,
+}
+# throttled requests by request name
+ROUTES = {}
+reporting.register("reddit_throttling", lambda: dict(STATS))
+reporting.register("reddit_throttled_routes", lambda: dict(ROUTES))
+
+
+def record(name, response):
+    """
+    Record the throttling a response signals
+
+    Args:
+        name (str): the request name
+        response (requests.Response): the response
+    """
+    headers = response.headers
+    remaining = headers.get("x-ratelimit-remaining")
+    if remaining is not None:
+        STATS["responses_with_ratelimit"] += 1
+
+    if response.status_code == TOO_MANY_REQUESTS:
+        STATS["too_many_requests"] += 1
+        wait = headers.get("retry-after") or headers.get("x-ratelimit-reset") or 0
+    elif remaining is not None and float(remaining) <= 0:
+        STATS["ratelimit_exhausted"] += 1
+        wait = headers.get("x-ratelimit-reset") or 0
+    else:
+        return
+
+    STATS["requested_wait_seconds"] += float(wait)
+    ROUTES[name] = ROUTES.get(name, 0) + 1
+
+
+class PassThroughRateLimiter:
+    """Stands in for prawcore's RateLimiter, never delaying a request"""
+    def __init__(self):
+        self.remaining = None
+        self.next_request_timestamp = None
+        self.reset_timestamp = None
+        self.used = None
+
+    def call(self, request_function, set_header_callback, *args, **kwargs):
+        """
+        Send a request right away, without waiting on or keeping the limits reddit reports
+
+        Args:
+            request_function (callable): sends the request, as prawcore's Requestor.request
+            set_header_callback (callable): returns the headers authorizing the request
+        """
+        kwargs["headers"] = set_header_callback()
+        return request_function(*args, **kwargs)
+
+
+def pass_through(core):
+    """
+    Replace the rate limiter and retry strategy of a prawcore session with pass-through versions
+
+    prawcore sleeps before any attempt but the first of three, so a single attempt also needs the
+    sleep taken out. A 401 is still retried once, as prawcore does, since that is how a pooled
+    client refreshes its expired access token.
+
+    Args:
+        core (prawcore.Session): the session, as praw.Reddit._core
+    """
+    # pylint: disable=protected-access
+    core._rate_limiter = PassThroughRateLimiter()
+    core._retry_sleep = lambda retries: None
+    request_with_retries = core._request_with_retries
+
+    def single_attempt(*args, **kwargs):
+        kwargs["retries"] = 1
+        try:
+            return request_with_retries(*args, **kwargs)
+        except ResponseException as ex:
+            # prawcore has cleared the access token, the next attempt refreshes it
+            if ex.response.status_code != UNAUTHORIZED or not hasattr(core._authorizer, "refresh"):
+                raise
+            return request_with_retries(*args, **kwargs)
+
+    core._request_with_retries = single_attempt
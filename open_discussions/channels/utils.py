@@ -1,7 +1,7 @@
 """
 Utility functions
 """
-from open_discussions_api.users.client import SUPPORTED_USER_ATTRIBUTES, quote
+from open_discussions_api.users.client import SUPPORTED_PROFILE_ATTRIBUTES, quote
 
 
 def patch_get_session(client):
@@ -21,7 +21,7 @@ def patched_user_update(self, username, **profile):
         raise AttributeError("No fields provided to update")
 
     for key in profile:
-        if key not in SUPPORTED_USER_ATTRIBUTES:
+        if key not in SUPPORTED_PROFILE_ATTRIBUTES:
             raise AttributeError("Argument {} is not supported".format(key))
 
     return self.session.patch(
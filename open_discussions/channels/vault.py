@@ -0,0 +1,167 @@
+"""
+On-disk store of reddit refresh tokens shared by every locust process on a host
+
+Workers read refresh tokens from here before asking /api/v1/generate_refresh_token for one, so
+starting many workers doesn't stampede the token endpoint. Fill it ahead of a run with:
+
+    python -m open_discussions.channels.vault provision --count 500 --concurrency 32
+"""
+import argparse
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+from open_discussions.channels import settings
+
+REFRESH_TOKEN_PATH = '/api/v1/generate_refresh_token'
+ACCESS_TOKEN_HEADER_NAME = 'X-Access-Token'
+
+
+class CredentialVault:
+    """A SQLite table of username to refresh token, safe to share between processes"""
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._usernames = None
+        # autocommit, each statement is its own transaction
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        # WAL lets readers in other processes carry on while a writer commits
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS credentials ("
+            "username TEXT PRIMARY KEY, refresh_token TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+
+    def get(self, username):
+        """
+        Args:
+            username (str): the reddit username
+
+        Returns:
+            str: the stored refresh token, or None
+        """
+        row = self.connection.execute(
+            "SELECT refresh_token FROM credentials WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, username, refresh_token):
+        """Store the refresh token for a user"""
+        self.put_many([(username, refresh_token)])
+
+    def put_many(self, credentials):
+        """
+        Store refresh tokens in a single transaction
+
+        Args:
+            credentials (list of tuple of (str, str)): (username, refresh token) pairs
+        """
+        if not credentials:
+            return
+        now = time.time()
+        # the connection autocommits, so the batch needs an explicit transaction to commit once
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO credentials (username, refresh_token, created_at) VALUES (?, ?, ?)",
+                [(username, refresh_token, now) for username, refresh_token in credentials]
+            )
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+        self.writes += len(credentials)
+
+    def usernames(self):
+        """
+        Returns:
+            list of str: the usernames in the vault, read once and then kept
+        """
+        if self._usernames is None:
+            self._usernames = [row[0] for row in self.connection.execute("SELECT username FROM credentials")]
+        return self._usernames
+
+    def stats(self):
+        """
+        Returns:
+            dict: the vault counters
+        """
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+
+def provision(vault, usernames, concurrency):
+    """
+    Request refresh tokens for users concurrently and store them
+
+    Args:
+        vault (CredentialVault): the vault to fill
+        usernames (list of str): the users, created on reddit if they don't exist
+        concurrency (int): the number of token requests in flight
+    """
+    url = urljoin(settings.OPEN_DISCUSSIONS_REDDIT_URL, REFRESH_TOKEN_PATH)
+    local = threading.local()
+
+    def fetch(username):
+        """Request a refresh token"""
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.verify = False
+            session.headers[ACCESS_TOKEN_HEADER_NAME] = settings.OPEN_DISCUSSIONS_REDDIT_ACCESS_TOKEN
+        response = session.get(url, params={'username': username})
+        response.raise_for_status()
+        return username, response.json()['refresh_token']
+
+    batch = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for number, credentials in enumerate(executor.map(fetch, usernames), start=1):
+            batch.append(credentials)
+            if len(batch) >= 100:
+                vault.put_many(batch)
+                batch = []
+                print("{}/{} users provisioned".format(number, len(usernames)))
+    vault.put_many(batch)
+
+
+def main():
+    """Fill the vault"""
+    parser = argparse.ArgumentParser(description="Pre-provision reddit users and refresh tokens")
+    subparsers = parser.add_subparsers(dest="command")
+    provision_parser = subparsers.add_parser("provision", help="create users and store their refresh tokens")
+    provision_parser.add_argument(
+        "--vault", default=settings.OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT or "credentials.sqlite3",
+        help="path of the vault, defaults to OPEN_DISCUSSIONS_REDDIT_CREDENTIAL_VAULT"
+    )
+    provision_parser.add_argument("--count", type=int, default=100, help="number of new users to create")
+    provision_parser.add_argument(
+        "--usernames-file", help="provision the usernames listed in this file, one per line, instead"
+    )
+    provision_parser.add_argument("--concurrency", type=int, default=16, help="number of token requests in flight")
+    args = parser.parse_args()
+    if args.command != "provision":
+        parser.print_help()
+        return
+
+    if args.usernames_file:
+        with open(args.usernames_file) as usernames_file:
+            usernames = [line.strip() for line in usernames_file if line.strip()]
+    else:
+        usernames = [uuid.uuid4().hex for _ in range(args.count)]
+    vault = CredentialVault(args.vault)
+    provision(vault, usernames, args.concurrency)
+    print("Provisioned {} users into {}".format(len(usernames), args.vault))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Calibrate which facet combinations return search hits
+
+Runs one hit-count-only search per facet combination and writes the results as a hit index:
+
+    python -m open_discussions.learn.calibrate https://discussions.example.com --output search_hits.bin
+"""
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+from open_discussions.learn import facets
+from open_discussions.learn.hits import write_hit_index
+from open_discussions.util.es import dumps, generate_query
+
+SEARCH_URL = "/api/v0/search/"
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+LOCAL = threading.local()
+
+
+def hit_count(results):
+    """
+    Returns:
+        int: the total hit count of a search response, in either Elasticsearch 6 or 7 format
+    """
+    total = results["hits"]["total"]
+    if isinstance(total, dict):
+        return total["value"]
+    return total
+
+
+def count_hits(url, combination):
+    """
+    Run a search for a combination without aggregations or hits
+
+    Args:
+        url (str): the search url
+        combination (int): the combination index
+
+    Returns:
+        int: the total hit count
+    """
+    session = getattr(LOCAL, "session", None)
+    if session is None:
+        session = LOCAL.session = requests.Session()
+    body = dumps({
+        "query": generate_query(facets.from_combination(combination)),
+        "from": 0,
+        "size": 0,
+    })
+    response = session.post(url, data=body, headers=JSON_HEADERS)
+    response.raise_for_status()
+    return hit_count(response.json())
+
+
+def main():
+    """Calibrate and write a hit index"""
+    parser = argparse.ArgumentParser(description="Calibrate which search facet combinations return hits")
+    parser.add_argument("host", help="protocol and hostname of the app, e.g. http://localhost:8063")
+    parser.add_argument("--output", required=True, help="path of the hit index file to write")
+    parser.add_argument("--url", default=SEARCH_URL, help="search url path")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of searches in flight")
+    args = parser.parse_args()
+
+    url = urljoin(args.host, args.url)
+    combinations = list(facets.iter_combinations())
+    productive = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        counts = executor.map(lambda combination: count_hits(url, combination), combinations)
+        for number, (combination, count) in enumerate(zip(combinations, counts), start=1):
+            if count:
+                productive.append(combination)
+            if number % 1000 == 0:
+                print("{}/{} combinations, {} productive".format(number, len(combinations), len(productive)))
+
+    write_hit_index(args.output, productive)
+    print("Wrote {} of {} productive combinations to {}".format(len(productive), len(combinations), args.output))
+
+
+if __name__ == "__main__":
+    main()
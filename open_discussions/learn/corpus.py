@@ -0,0 +1,124 @@
+"""
+Offline-compiled corpus of learn search query bodies
+
+The corpus file holds the encoded `query` part of generate_learn_query() for a population of
+search parameters, so workers can pick a search by integer index instead of generating it.
+Build one with:
+
+    python -m open_discussions.learn.corpus corpus.bin --size 20000 --seed 1
+
+Layout (little endian):
+    header: magic, entry count, length of the texts JSON
+    texts:  JSON list of the search texts the combination indexes are relative to
+    index:  per entry, offset and length of its query in the blob and its combination index
+    blob:   the encoded queries, each distinct combination stored once
+"""
+import argparse
+import json
+import mmap
+import random
+import struct
+
+from open_discussions.learn import facets
+from open_discussions.util.es import dumps, generate_query
+
+MAGIC = b"LQC1"
+HEADER = struct.Struct("<4sII")
+RECORD = struct.Struct("<QII")
+
+
+def write_corpus(path, combinations, texts=facets.TEXTS):
+    """
+    Write a corpus file
+
+    Args:
+        path (str): the output path
+        combinations (list of int): the combination index of each entry, duplicates are allowed
+        texts (list of str): the search texts the combination indexes are relative to
+    """
+    blob = bytearray()
+    locations = {}
+    records = []
+    for combination in combinations:
+        if combination not in locations:
+            query_json = dumps(generate_query(facets.from_combination(combination, texts)))
+            locations[combination] = (len(blob), len(query_json))
+            blob += query_json
+        offset, length = locations[combination]
+        records.append(RECORD.pack(offset, length, combination))
+
+    texts_json = dumps(texts)
+    with open(path, "wb") as corpus_file:
+        corpus_file.write(HEADER.pack(MAGIC, len(records), len(texts_json)))
+        corpus_file.write(texts_json)
+        corpus_file.write(b"".join(records))
+        corpus_file.write(blob)
+
+
+class Corpus:
+    """A memory-mapped, read-only corpus file"""
+    def __init__(self, path):
+        with open(path, "rb") as corpus_file:
+            self._mmap = mmap.mmap(corpus_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, texts_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a search corpus file".format(path))
+        self._index_start = HEADER.size + texts_length
+        self._blob_start = self._index_start + self._count * RECORD.size
+        self.texts = json.loads(self._mmap[HEADER.size:self._index_start].decode("utf-8"))
+
+    def __len__(self):
+        return self._count
+
+    def combination(self, index):
+        """
+        Returns:
+            int: the combination index of an entry
+        """
+        return RECORD.unpack_from(self._mmap, self._index_start + index * RECORD.size)[2]
+
+    def entry(self, index):
+        """
+        Read an entry
+
+        Args:
+            index (int): the entry index
+
+        Returns:
+            tuple of (QueryParams, bytes): the search parameters and the encoded query
+        """
+        offset, length, combination = RECORD.unpack_from(self._mmap, self._index_start + index * RECORD.size)
+        start = self._blob_start + offset
+        return facets.from_combination(combination, self.texts), self._mmap[start:start + length]
+
+    def random_entry(self):
+        """
+        Returns:
+            tuple of (QueryParams, bytes): a uniformly chosen entry
+        """
+        return self.entry(random.randrange(self._count))
+
+
+def main():
+    """Build a corpus file"""
+    parser = argparse.ArgumentParser(description="Compile a corpus of learn search queries")
+    parser.add_argument("output", help="path of the corpus file to write")
+    parser.add_argument(
+        "--size", type=int, default=20000,
+        help="number of entries sampled the same way SearchPage.new_search picks its parameters"
+    )
+    parser.add_argument("--all", action="store_true", help="enumerate every facet combination instead of sampling")
+    parser.add_argument("--seed", type=int, default=None, help="random seed, for a reproducible corpus")
+    args = parser.parse_args()
+
+    if args.all:
+        combinations = list(facets.iter_combinations())
+    else:
+        random.seed(args.seed)
+        combinations = [facets.to_combination(facets.random_params()) for _ in range(args.size)]
+    write_corpus(args.output, combinations)
+    print("Wrote {} entries ({} distinct) to {}".format(len(combinations), len(set(combinations)), args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Refinement of a search by clicking on the facet buckets of the previous response
+"""
+import random
+
+from open_discussions.util.es import OfferedByType, ResourceType
+
+FACETS = ("type", "offered_by", "topics", "availability")
+
+
+def _refined(params, facet, key):
+    """
+    Returns:
+        QueryParams: the params narrowed by a bucket, or None if the bucket is already applied
+    """
+    if facet == "type":
+        resource_type = ResourceType(key)
+        if params.types == [resource_type]:
+            return None
+        return params._replace(types=[resource_type])
+    if facet == "offered_by":
+        offered_by = OfferedByType(key)
+        if offered_by in params.offered_by:
+            return None
+        return params._replace(offered_by=list(params.offered_by) + [offered_by])
+    if facet == "topics":
+        if key in params.topics:
+            return None
+        return params._replace(topics=list(params.topics) + [key])
+    if params.availability is not None:
+        return None
+    return params._replace(availability=key)
+
+
+def _candidates(params, facet, buckets):
+    """
+    Returns:
+        list of tuple of (QueryParams, int): the possible refinements for a facet with their doc counts
+    """
+    candidates = []
+    for key, doc_count in buckets:
+        if not doc_count:
+            continue
+        try:
+            refined = _refined(params, facet, key)
+        except ValueError:
+            # a bucket for a value this test doesn't know about
+            continue
+        if refined is not None:
+            candidates.append((refined, doc_count))
+    return candidates
+
+
+def refine(params, buckets, follow_largest):
+    """
+    Narrow a search by one facet bucket, the way a user clicks on a facet
+
+    Args:
+        params (QueryParams): the current search parameters
+        buckets (dict): the aggregation buckets of the current results, see es.aggregation_buckets()
+        follow_largest (float): the probability of clicking the largest bucket of the facet,
+            otherwise a bucket is picked in proportion to its doc count
+
+    Returns:
+        QueryParams: the refined search parameters, or None if there is nothing left to refine by
+    """
+    by_facet = {facet: _candidates(params, facet, buckets.get(facet, [])) for facet in FACETS}
+    facets = [facet for facet, candidates in by_facet.items() if candidates]
+    if not facets:
+        return None
+
+    candidates = by_facet[random.choice(facets)]
+    if random.random() < follow_largest:
+        return max(candidates, key=lambda candidate: candidate[1])[0]
+    return random.choices(
+        [refined for refined, _ in candidates],
+        weights=[doc_count for _, doc_count in candidates],
+    )[0]
@@ -0,0 +1,132 @@
+"""
+The facet space sampled by the learn search tests
+
+Every combination of search text, resource types, offered by and price is numbered so it can be
+stored compactly: the types and offered by values are encoded as bitmasks over their enums.
+"""
+import random
+
+from open_discussions.util.es import ResourceType, OfferedByType, QueryParams, PriceType
+
+TEXTS = [
+    "",  # no text, search all items
+    "\"Quantum Mechanics\"",
+    "\"Machine Learning\"",
+    "Albedo",
+    "Kinetic"
+]
+
+RESOURCE_TYPES = list(ResourceType)
+OFFERED_BY_TYPES = list(OfferedByType)
+PRICE_TYPES = list(PriceType)
+
+TYPES_MASKS = 1 << len(RESOURCE_TYPES)
+OFFERED_BY_MASKS = 1 << len(OFFERED_BY_TYPES)
+PRICE_CODES = len(PRICE_TYPES) + 1
+
+
+def random_params(texts=TEXTS):
+    """
+    Pick random search parameters
+
+    Args:
+        texts (list of str): the search texts to pick from
+
+    Returns:
+        QueryParams: the search parameters
+    """
+    # NOTE: sometimes the permutation generated here will return zero results
+    #       because the facet combinations don't make sense
+    #       that's a bit too complicated to codify so we don't worry about it for now
+    return QueryParams(
+        # text search
+        random.choice(texts),
+        # learning resource types 1..n
+        random.sample(
+            RESOURCE_TYPES,
+            random.randint(1, len(RESOURCE_TYPES))
+        ),
+        # offered by 0..n
+        random.sample(
+            OFFERED_BY_TYPES,
+            random.randint(0, len(OFFERED_BY_TYPES))
+        ),
+        # price 0..1
+        random.sample(
+            PRICE_TYPES,
+            random.randint(0, 1)
+        )
+    )
+
+
+def _mask(members, universe):
+    """Encode a collection of enum members as a bitmask over universe"""
+    mask = 0
+    for member in members:
+        mask |= 1 << universe.index(member)
+    return mask
+
+
+def _unmask(mask, universe):
+    """Decode a bitmask over universe into a list of enum members"""
+    return [member for index, member in enumerate(universe) if mask & (1 << index)]
+
+
+def combination_count(texts=TEXTS):
+    """
+    Returns:
+        int: the number of combination indexes, including those without any resource type
+    """
+    return len(texts) * TYPES_MASKS * OFFERED_BY_MASKS * PRICE_CODES
+
+
+def to_combination(params, texts=TEXTS):
+    """
+    Number a set of search parameters
+
+    Args:
+        params (QueryParams): the search parameters
+        texts (list of str): the search texts the index is relative to
+
+    Returns:
+        int: the combination index
+    """
+    price_code = PRICE_TYPES.index(params.price[0]) + 1 if params.price else 0
+    index = texts.index(params.text)
+    index = index * TYPES_MASKS + _mask(params.types, RESOURCE_TYPES)
+    index = index * OFFERED_BY_MASKS + _mask(params.offered_by, OFFERED_BY_TYPES)
+    return index * PRICE_CODES + price_code
+
+
+def from_combination(index, texts=TEXTS):
+    """
+    Decode a combination index, the inverse of to_combination()
+
+    Args:
+        index (int): the combination index
+        texts (list of str): the search texts the index is relative to
+
+    Returns:
+        QueryParams: the search parameters, with facet values in enum order
+    """
+    index, price_code = divmod(index, PRICE_CODES)
+    index, offered_by_mask = divmod(index, OFFERED_BY_MASKS)
+    text_index, types_mask = divmod(index, TYPES_MASKS)
+    return QueryParams(
+        texts[text_index],
+        _unmask(types_mask, RESOURCE_TYPES),
+        _unmask(offered_by_mask, OFFERED_BY_TYPES),
+        [PRICE_TYPES[price_code - 1]] if price_code else [],
+    )
+
+
+def iter_combinations(texts=TEXTS):
+    """
+    Iterate over every valid combination index, skipping those without a resource type
+
+    Yields:
+        int: a combination index
+    """
+    for index in range(combination_count(texts)):
+        if (index // (PRICE_CODES * OFFERED_BY_MASKS)) % TYPES_MASKS:
+            yield index
@@ -0,0 +1,109 @@
+"""
+Index of which facet combinations return search hits
+
+The index is a bitset over the combination indexes from open_discussions.learn.facets, one bit
+per combination, set when the combination returned at least one hit during calibration.
+Build one with `python -m open_discussions.learn.calibrate`.
+
+Layout (little endian):
+    header: magic, number of combinations, length of the texts JSON
+    texts:  JSON list of the search texts the combination indexes are relative to
+    bitset: one bit per combination index
+"""
+import json
+import random
+import struct
+from array import array
+
+from open_discussions.learn import facets
+from open_discussions.util.es import dumps
+
+MAGIC = b"LHI1"
+HEADER = struct.Struct("<4sII")
+# how many times to redraw random parameters before picking from the enumerated combinations
+MAX_REDRAWS = 20
+
+
+def write_hit_index(path, productive, texts=facets.TEXTS):
+    """
+    Write a hit index file
+
+    Args:
+        path (str): the output path
+        productive (iterable of int): the combination indexes which returned hits
+        texts (list of str): the search texts the combination indexes are relative to
+    """
+    count = facets.combination_count(texts)
+    bitset = bytearray((count + 7) // 8)
+    for combination in productive:
+        bitset[combination >> 3] |= 1 << (combination & 7)
+
+    texts_json = dumps(texts)
+    with open(path, "wb") as index_file:
+        index_file.write(HEADER.pack(MAGIC, count, len(texts_json)))
+        index_file.write(texts_json)
+        index_file.write(bitset)
+
+
+class HitIndex:
+    """A loaded hit index"""
+    def __init__(self, path):
+        with open(path, "rb") as index_file:
+            data = index_file.read()
+        magic, self.count, texts_length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a search hit index file".format(path))
+        self.texts = json.loads(data[HEADER.size:HEADER.size + texts_length].decode("utf-8"))
+        self.bitset = data[HEADER.size + texts_length:]
+
+    def is_productive(self, combination):
+        """
+        Returns:
+            bool: True if the combination returned hits during calibration
+        """
+        return bool(self.bitset[combination >> 3] & (1 << (combination & 7)))
+
+
+class SearchSampler:
+    """
+    Picks searches so that only a configured share of them are known to return zero hits
+
+    Searches are drawn from the corpus if one is given, otherwise the same way as random_params().
+    """
+    def __init__(self, hit_index, zero_hit_share, corpus=None):
+        texts = corpus.texts if corpus is not None else facets.TEXTS
+        if hit_index.texts != texts:
+            raise ValueError("The hit index was calibrated against different search texts")
+        self.hit_index = hit_index
+        self.zero_hit_share = zero_hit_share
+        self.corpus = corpus
+
+        # entries (corpus) or combinations (no corpus) partitioned by whether they return hits
+        self.pools = {True: array("L"), False: array("L")}
+        if corpus is not None:
+            for index in range(len(corpus)):
+                self.pools[hit_index.is_productive(corpus.combination(index))].append(index)
+        else:
+            for combination in facets.iter_combinations():
+                self.pools[hit_index.is_productive(combination)].append(combination)
+        if not self.pools[True]:
+            raise ValueError("The hit index has no productive combinations")
+
+    def sample(self):
+        """
+        Pick a search
+
+        Returns:
+            tuple of (QueryParams, bytes): the search parameters, and the encoded query
+                if the search came from the corpus, otherwise None
+        """
+        productive = random.random() >= self.zero_hit_share or not self.pools[False]
+        if self.corpus is not None:
+            return self.corpus.entry(random.choice(self.pools[productive]))
+
+        # redraw to keep the distribution of random_params(), falling back to a uniform pick
+        for _ in range(MAX_REDRAWS):
+            params = facets.random_params()
+            if self.hit_index.is_productive(facets.to_combination(params)) == productive:
+                return params, None
+        return facets.from_combination(random.choice(self.pools[productive])), None
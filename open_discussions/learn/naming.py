@@ -0,0 +1,91 @@
+"""
+Request naming for the learn search tests
+
+Locust stats are keyed by request name, so names only carry the shape of a search and a page
+bucket. The individual facet values are reported as latency dimensions instead.
+"""
+
+PAGE_BUCKETS = (
+    (0, "0"),
+    (1, "1"),
+    (4, "2-4"),
+    (9, "5-9"),
+)
+LAST_PAGE_BUCKET = "10+"
+
+
+def text_shape(text):
+    """
+    Returns:
+        str: "none" for an empty search, "phrase" for a quoted search, otherwise "terms"
+    """
+    if not text:
+        return "none"
+    if "\"" in text:
+        return "phrase"
+    return "terms"
+
+
+def page_bucket(page):
+    """
+    Returns:
+        str: the bucket a page number falls into
+    """
+    for upper, bucket in PAGE_BUCKETS:
+        if page <= upper:
+            return bucket
+    return LAST_PAGE_BUCKET
+
+
+def request_name(url, params, page, aggs="all"):
+    """
+    Build a bounded-cardinality request name for a search
+
+    Args:
+        url (str): the url searched against
+        params (QueryParams): the search parameters
+        page (int): the page number
+        aggs (str): which aggregations were requested
+
+    Returns:
+        str: the name to report the request under
+    """
+    filtered = "filtered" if params.offered_by or params.price else "unfiltered"
+    return f"{url} [q={text_shape(params.text)} {filtered} p={page_bucket(page)} aggs={aggs}]"
+
+
+def search_dimensions(params, page, aggs="all"):
+    """
+    List the dimensions a search is recorded under
+
+    Args:
+        params (QueryParams): the search parameters
+        page (int): the page number
+        aggs (str): which aggregations were requested
+
+    Returns:
+        list of tuple of (str, str): (dimension, value) pairs
+    """
+    dimensions = [
+        ("text", params.text or "<none>"),
+        ("page", page_bucket(page)),
+        ("aggs", aggs),
+        ("type_count", str(len(params.types))),
+        ("price", params.price[0].value if params.price else "<any>"),
+        ("topic_count", str(len(params.topics))),
+        ("availability", params.availability or "<any>"),
+    ]
+    dimensions.extend(("type", resource_type.value) for resource_type in params.types)
+    if params.offered_by:
+        dimensions.extend(("offered_by", offered_by.value) for offered_by in params.offered_by)
+    else:
+        dimensions.append(("offered_by", "<any>"))
+    return dimensions
+
+
+def drilldown_name(url, step):
+    """
+    Returns:
+        str: the name to report a search of a drill-down session under
+    """
+    return f"{url} [drilldown step={step}]"
@@ -1,20 +1,93 @@
 """Tests for discussions learn search"""
 import random
+import time
 
+import gevent
 from locust import HttpLocust, TaskSet, task, between
 
-from open_discussions.util.es import generate_learn_query, ResourceType, OfferedByType, QueryParams, PriceType
-
-TEXTS = [
-    "",  # no text, search all items
-    "\"Quantum Mechanics\"",
-    "\"Machine Learning\"",
-    "Albedo",
-    "Kinetic"
-]
+from open_discussions.learn import settings
+from open_discussions.learn.corpus import Corpus
+from open_discussions.learn import drilldown
+from open_discussions.learn.facets import RESOURCE_TYPES, TEXTS, random_params
+from open_discussions.learn.hits import HitIndex, SearchSampler
+from open_discussions.learn.naming import drilldown_name, request_name, search_dimensions
+from open_discussions.util import reporting
+from open_discussions.util.dimensions import DimensionalLatency
+from open_discussions.util.es import (
+    AGGREGATION_NAMES,
+    QueryCache,
+    QueryParams,
+    aggregation_buckets,
+    splice_learn_query,
+    stream_hit_count,
+)
 
 LIMIT = 6
 SEARCH_URL = "/api/v0/search/"
+JSON_HEADERS = {"Content-Type": "application/json"}
+NDJSON_HEADERS = {"Content-Type": "application/x-ndjson"}
+
+QUERY_CACHE = QueryCache(settings.SEARCH_QUERY_CACHE_SIZE)
+reporting.register("search_query_cache", QUERY_CACHE.stats)
+
+AGGS_MODES = ["all", "first_page", "none", "single"] + [f"single:{name}" for name in AGGREGATION_NAMES]
+if settings.SEARCH_AGGS_MODE not in AGGS_MODES:
+    raise Exception("SEARCH_AGGS_MODE must be one of {}".format(", ".join(AGGS_MODES)))
+
+# parsing is timed outside of locust's stats, so it doesn't count as requests
+PARSE_STATS = {"responses": 0, "bytes": 0, "parse_ms": 0}
+reporting.register("search_parsing", lambda: dict(PARSE_STATS))
+
+# typeahead searches type the search texts without quotes
+TYPEAHEAD_TEXTS = [text.strip("\"") for text in TEXTS if text]
+TYPEAHEAD_STATS = {"sessions": 0, "requests": 0, "wasted": 0}
+reporting.register("search_typeahead", lambda: dict(TYPEAHEAD_STATS))
+# the time from the last keystroke to the final result, a histogram so its percentiles are logged
+TYPEAHEAD_LATENCY = DimensionalLatency("typeahead")
+
+SEARCH_LATENCY = DimensionalLatency("search", csv_path=settings.SEARCH_DIMENSIONS_CSV)
+
+CORPUS = Corpus(settings.SEARCH_CORPUS_PATH) if settings.SEARCH_CORPUS_PATH else None
+SAMPLER = SearchSampler(
+    HitIndex(settings.SEARCH_HIT_INDEX_PATH),
+    settings.SEARCH_ZERO_HIT_SHARE,
+    corpus=CORPUS,
+) if settings.SEARCH_HIT_INDEX_PATH else None
+
+
+def pick_aggregations(page):
+    """
+    Pick which aggregations to request according to SEARCH_AGGS_MODE
+
+    Args:
+        page (int): the page number
+
+    Returns:
+        str: "all", "none" or the name of a single aggregation
+    """
+    mode = settings.SEARCH_AGGS_MODE
+    if mode == "first_page":
+        return "all" if page == 0 else "none"
+    if mode == "single":
+        return random.choice(AGGREGATION_NAMES)
+    if mode.startswith("single:"):
+        return mode.split(":", 1)[1]
+    return mode
+
+
+def pick_search():
+    """
+    Pick the parameters for a new search
+
+    Returns:
+        tuple of (QueryParams, bytes): the search parameters, and the encoded query
+            if the search came from the corpus, otherwise None
+    """
+    if SAMPLER is not None:
+        return SAMPLER.sample()
+    if CORPUS is not None:
+        return CORPUS.random_entry()
+    return random_params(), None
 
 
 class SearchPage(TaskSet):
@@ -24,64 +97,86 @@ class SearchPage(TaskSet):
     This operates by generating random tasks for a new search and subsequent
     search pages at a 1-to-10 ratio. If the pages are exhausted we initiate a new search.
 
-    Search criteria (text and resource type) are randomly selected at the start of a new search.
+    Searches are sent through the app's search API, see ElasticsearchSearchPage for sending
+    the same bodies to Elasticsearch directly.
+
+    Which aggregations each page requests is set by SEARCH_AGGS_MODE: "all" on every page,
+    "first_page" only, "none", "single" for one randomly picked aggregation per request,
+    or "single:<name>" for always the same one.
+
+    Search criteria (text and resource type) are randomly selected at the start of a new search,
+    or picked from the precompiled corpus if SEARCH_CORPUS_PATH is set. With a hit index
+    (SEARCH_HIT_INDEX_PATH) only SEARCH_ZERO_HIT_SHARE of the searches return zero hits.
     """
 
+    search_url = SEARCH_URL
+
     def on_start(self):
         """Start the task"""
         # search() task must be the first one
         self.schedule_task(self.new_search)
 
+    def _request_body(self, body):
+        """
+        Returns:
+            tuple of (bytes, dict): the request body and headers for an encoded learn query
+        """
+        return body, JSON_HEADERS
+
+    def _hits(self, results):
+        """
+        Returns:
+            list: the hits of a decoded search response
+        """
+        return results["hits"]["hits"]
+
     def _execute_search(self):
         """Execute a search request"""
         offset = self.page * LIMIT
-        query = generate_learn_query(
-            self.params,
-            offset=offset,
-            limit=LIMIT
-        )
-        # for now we ignore the response
-        results = self.client.post(
-            SEARCH_URL,
-            json=query,
-            name=(
-                f"{SEARCH_URL}"
-                f"?q={self.params.text}"
-                f"&type={','.join([rt.value for rt in self.params.types])}"
-                f"&o={','.join([o.value for o in self.params.offered_by])}"
-                f"&p={self.page}"
-            )
-        ).json()
+        aggs = pick_aggregations(self.page)
+        if self.query_json is not None:
+            body = splice_learn_query(self.query_json, offset, LIMIT, aggs=aggs)
+        else:
+            body = QUERY_CACHE.get(self.params, offset, LIMIT, aggs=aggs)
+        body, headers = self._request_body(body)
+        name = request_name(self.search_url, self.params, self.page, aggs=aggs)
+        dimensions = search_dimensions(self.params, self.page, aggs=aggs)
+        start = time.monotonic()
+        if settings.SEARCH_RESPONSE_PARSING == "stream":
+            # locust times a streamed request up to the response headers, so it is reported once
+            # the whole body is read, less the parsing, to be comparable with the buffered mode
+            with self.client.post(
+                self.search_url, data=body, headers=headers, name=name, stream=True, catch_response=True
+            ) as response:
+                if 200 <= response.status_code < 300:
+                    hit_count, length, parse_time = stream_hit_count(
+                        response.iter_content(settings.SEARCH_STREAM_CHUNK_SIZE)
+                    )
+                else:
+                    hit_count, length, parse_time = None, 0, 0.0
+                elapsed = (time.monotonic() - start - parse_time) * 1000
+                response.locust_request_meta["response_time"] = elapsed
+                response.locust_request_meta["content_size"] = length
+            SEARCH_LATENCY.record(dimensions, elapsed)
+        else:
+            response = self.client.post(self.search_url, data=body, headers=headers, name=name)
+            SEARCH_LATENCY.record(dimensions, (time.monotonic() - start) * 1000)
+            parse_start = time.monotonic()
+            hit_count = len(self._hits(response.json()))
+            length = len(response.content)
+            parse_time = time.monotonic() - parse_start
+        PARSE_STATS["responses"] += 1
+        PARSE_STATS["bytes"] += length
+        PARSE_STATS["parse_ms"] += parse_time * 1000
         # if we've run out of pages, queue a new search next
-        if len(results["hits"]["hits"]) < LIMIT:
+        if hit_count is None or hit_count < LIMIT:
             self.schedule_task(self.new_search, first=True)
 
     @task(1)
     def new_search(self):
         """Start a new search"""
         self.page = 0
-        # NOTE: sometimes the permutation generated here will return zero results
-        #       because the facet combinations don't make sense
-        #       that's a bit too complicated to codify so we don't worry about it for now
-        self.params = QueryParams(
-            # text search
-            random.choice(TEXTS),
-            # learning resource types 1..n
-            random.sample(
-                list(ResourceType),
-                random.randint(1, len(ResourceType))
-            ),
-            # offered by 0..n
-            random.sample(
-                list(OfferedByType),
-                random.randint(0, len(OfferedByType))
-            ),
-            # price 0..1
-            random.sample(
-                list(PriceType),
-                random.randint(0, 1)
-            )
-        )
+        self.params, self.query_json = pick_search()
         self._execute_search()
 
     # generally this will be run 10x as often as a new search
@@ -92,6 +187,153 @@ class SearchPage(TaskSet):
         self._execute_search()
 
 
+class ElasticsearchSearchPage(SearchPage):
+    """
+    TaskSet sending the same searches as SearchPage straight to Elasticsearch
+
+    Comparing its latency with SearchPage's shows how much of it is overhead of the app.
+    Requests go to the ELASTICSEARCH_ENDPOINT (_search or _msearch) of ELASTICSEARCH_INDEX.
+    """
+
+    search_url = f"/{settings.ELASTICSEARCH_INDEX}/{settings.ELASTICSEARCH_ENDPOINT}"
+
+    def _request_body(self, body):
+        """
+        Returns:
+            tuple of (bytes, dict): the request body and headers for an encoded learn query
+        """
+        if settings.ELASTICSEARCH_ENDPOINT == "_msearch":
+            # a header line, empty since the index is in the url, and the query
+            return b"{}\n" + body + b"\n", NDJSON_HEADERS
+        return body, JSON_HEADERS
+
+    def _hits(self, results):
+        """
+        Returns:
+            list: the hits of a decoded search response
+        """
+        if settings.ELASTICSEARCH_ENDPOINT == "_msearch":
+            return results["responses"][0]["hits"]["hits"]
+        return results["hits"]["hits"]
+
+
+class TypeaheadSearch(TaskSet):
+    """
+    TaskSet simulating a user typing into the search box
+
+    Keystrokes are spaced SEARCH_TYPEAHEAD_KEYSTROKE_MS apart on average and a search is sent
+    for each prefix the user pauses on for at least SEARCH_TYPEAHEAD_DEBOUNCE_MS. A search still
+    in flight when a newer prefix is sent is abandoned (and cancelled if SEARCH_TYPEAHEAD_CANCEL)
+    and counted as wasted. The time from the last keystroke to the final result is recorded in
+    TYPEAHEAD_LATENCY.
+    """
+
+    search_url = SEARCH_URL
+
+    def _search_prefix(self, params):
+        """Execute the search for a prefix"""
+        body = QUERY_CACHE.get(params, 0, LIMIT, aggs=pick_aggregations(0))
+        TYPEAHEAD_STATS["requests"] += 1
+        self.client.post(self.search_url, data=body, headers=JSON_HEADERS, name=f"{self.search_url} [typeahead]")
+
+    @task
+    def type_search(self):
+        """Type a search text one keystroke at a time"""
+        text = random.choice(TYPEAHEAD_TEXTS)
+        params = random_params()
+        debounce = settings.SEARCH_TYPEAHEAD_DEBOUNCE_MS / 1000
+        # the pause before each keystroke
+        gaps = [random.expovariate(1000 / settings.SEARCH_TYPEAHEAD_KEYSTROKE_MS) for _ in text]
+        in_flight = None
+        last_keystroke = None
+        TYPEAHEAD_STATS["sessions"] += 1
+
+        for position, gap in enumerate(gaps, start=1):
+            gevent.sleep(gap)
+            last_keystroke = time.monotonic()
+            if position < len(gaps):
+                if gaps[position] < debounce:
+                    # the next keystroke comes before the debounce fires
+                    continue
+                gaps[position] -= debounce
+            gevent.sleep(debounce)
+
+            if in_flight is not None and not in_flight.ready():
+                TYPEAHEAD_STATS["wasted"] += 1
+                if settings.SEARCH_TYPEAHEAD_CANCEL:
+                    in_flight.kill(block=False)
+            in_flight = gevent.spawn(self._search_prefix, params._replace(text=text[:position]))
+
+        in_flight.join()
+        TYPEAHEAD_LATENCY.record([("time_to_final_result", "all")], (time.monotonic() - last_keystroke) * 1000)
+
+
+class RefineSearch(TaskSet):
+    """
+    TaskSet for a user refining a search through the facets
+
+    A session starts with an unfiltered search, then each step clicks a bucket of the type,
+    offered_by, topics or availability aggregations returned by the previous step: the largest
+    bucket with probability SEARCH_DRILLDOWN_FOLLOW_LARGEST, otherwise one picked in proportion
+    to its doc count. A new session starts after SEARCH_DRILLDOWN_MAX_STEPS steps or once there
+    is nothing left to refine by.
+    """
+
+    search_url = SEARCH_URL
+
+    def on_start(self):
+        """Start the task"""
+        # new_session() task must be the first one
+        self.schedule_task(self.new_session)
+
+    def _execute_search(self):
+        """Execute a search request and keep the buckets of the response"""
+        body = QUERY_CACHE.get(self.params, 0, LIMIT, aggs="all")
+        start = time.monotonic()
+        response = self.client.post(
+            self.search_url,
+            data=body,
+            headers=JSON_HEADERS,
+            name=drilldown_name(self.search_url, self.step),
+        )
+        SEARCH_LATENCY.record(search_dimensions(self.params, 0), (time.monotonic() - start) * 1000)
+        self.buckets = aggregation_buckets(response.json())
+
+    @task(1)
+    def new_session(self):
+        """Start a new, unfiltered search"""
+        self.step = 0
+        self.params = QueryParams(random.choice(TEXTS), RESOURCE_TYPES, [], [])
+        self._execute_search()
+
+    @task(10)
+    def refine(self):
+        """Refine the search by one facet bucket"""
+        params = drilldown.refine(self.params, self.buckets, settings.SEARCH_DRILLDOWN_FOLLOW_LARGEST)
+        if params is None or self.step >= settings.SEARCH_DRILLDOWN_MAX_STEPS:
+            self.new_session()
+            return
+        self.step += 1
+        self.params = params
+        self._execute_search()
+
+
 class AnonymousUser(HttpLocust):
     task_set = SearchPage
     wait_time = between(1, 10)
+
+
+class ElasticsearchUser(HttpLocust):
+    host = settings.ELASTICSEARCH_URL
+    task_set = ElasticsearchSearchPage
+    wait_time = between(1, 10)
+
+
+class TypeaheadUser(HttpLocust):
+    task_set = TypeaheadSearch
+    wait_time = between(1, 10)
+
+
+class RefineUser(HttpLocust):
+    task_set = RefineSearch
+    wait_time = between(1, 10)
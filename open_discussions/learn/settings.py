@@ -0,0 +1,46 @@
+"""
+Settings for the open_discussions learn locust tests
+"""
+import os
+
+
+def get_var(name, default=None):
+    """Return the settings in a the environment"""
+    return os.environ.get(name, default)
+
+
+# number of encoded search request bodies kept per worker, 0 disables the cache
+SEARCH_QUERY_CACHE_SIZE = int(get_var('SEARCH_QUERY_CACHE_SIZE', 4096))
+
+# path to a corpus built with `python -m open_discussions.learn.corpus`, searches are then replayed from it
+SEARCH_CORPUS_PATH = get_var('SEARCH_CORPUS_PATH')
+
+# optional path to write the search latency broken down by facet to when locust quits
+SEARCH_DIMENSIONS_CSV = get_var('SEARCH_DIMENSIONS_CSV')
+
+# path to a hit index built with `python -m open_discussions.learn.calibrate`
+SEARCH_HIT_INDEX_PATH = get_var('SEARCH_HIT_INDEX_PATH')
+# with a hit index, the share of searches picked from combinations known to return zero hits
+SEARCH_ZERO_HIT_SHARE = float(get_var('SEARCH_ZERO_HIT_SHARE', 0))
+
+# "full" decodes each search response, "stream" only decodes the hits and reads past the aggregations
+SEARCH_RESPONSE_PARSING = get_var('SEARCH_RESPONSE_PARSING', 'full')
+SEARCH_STREAM_CHUNK_SIZE = int(get_var('SEARCH_STREAM_CHUNK_SIZE', 16384))
+
+# direct-to-Elasticsearch searches (ElasticsearchUser)
+ELASTICSEARCH_URL = get_var('ELASTICSEARCH_URL', 'http://localhost:9200')
+ELASTICSEARCH_INDEX = get_var('ELASTICSEARCH_INDEX', 'discussions_local_all_default')
+# "_search" or "_msearch"
+ELASTICSEARCH_ENDPOINT = get_var('ELASTICSEARCH_ENDPOINT', '_search')
+
+# which aggregations searches request: all, first_page, none, single or single:<aggregation name>
+SEARCH_AGGS_MODE = get_var('SEARCH_AGGS_MODE', 'all')
+
+# typeahead searches (TypeaheadUser)
+SEARCH_TYPEAHEAD_KEYSTROKE_MS = float(get_var('SEARCH_TYPEAHEAD_KEYSTROKE_MS', 150))
+SEARCH_TYPEAHEAD_DEBOUNCE_MS = float(get_var('SEARCH_TYPEAHEAD_DEBOUNCE_MS', 200))
+SEARCH_TYPEAHEAD_CANCEL = get_var('SEARCH_TYPEAHEAD_CANCEL', 'true').lower() == 'true'
+
+# facet drill-down sessions (RefineUser)
+SEARCH_DRILLDOWN_MAX_STEPS = int(get_var('SEARCH_DRILLDOWN_MAX_STEPS', 4))
+SEARCH_DRILLDOWN_FOLLOW_LARGEST = float(get_var('SEARCH_DRILLDOWN_FOLLOW_LARGEST', 0.7))
@@ -0,0 +1,144 @@
+"""
+A local stand-in for the search backend, for trying out the search tests without a real cluster
+
+Answers POSTs to any `_search` or `_msearch` path as well as `/api/v0/search/` with a fixed number
+of fake hits and aggregation buckets shaped like the ones generate_learn_query() asks for:
+
+    python -m open_discussions.learn.stub_es --port 9200 --total 40
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from open_discussions.util.es import OfferedByType, ResourceType, dumps
+
+TOPICS = ["Physics", "Mathematics", "Computer Science", "Engineering", "Economics", "Biology"]
+AVAILABILITY = ["availableNow", "nextWeek", "nextMonth", "next3Months", "next6Months", "nextYear"]
+
+
+def _buckets(keys):
+    """Fake terms buckets with decreasing counts"""
+    return [{"key": key, "doc_count": random.randint(1, 100) * (len(keys) - index)} for index, key in enumerate(keys)]
+
+
+def fake_search_response(query, total):
+    """
+    Build a search response for a query
+
+    Args:
+        query (dict): the decoded search request body
+        total (int): the total number of hits to pretend exist
+
+    Returns:
+        dict: the search response
+    """
+    offset = query.get("from", 0)
+    size = query.get("size", 10)
+    hits = [{
+        "_index": "stub",
+        "_id": str(position),
+        "_score": 1.0,
+        "_source": {
+            "id": position,
+            "title": "Stub result {}".format(position),
+            "object_type": random.choice(list(ResourceType)).value,
+        },
+    } for position in range(offset, min(offset + size, total))]
+
+    response = {
+        "took": 1,
+        "timed_out": False,
+        "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+        "hits": {"total": {"value": total, "relation": "eq"}, "max_score": 1.0, "hits": hits},
+    }
+    aggs = query.get("aggs") or {}
+    if aggs:
+        response["aggregations"] = {}
+    for name in aggs:
+        if name == "availability":
+            response["aggregations"][name] = {
+                "doc_count": total,
+                "runs": {"buckets": [dict(bucket, courses={"doc_count": bucket["doc_count"]})
+                                     for bucket in _buckets(AVAILABILITY)]},
+            }
+        elif name == "cost":
+            response["aggregations"][name] = {
+                "doc_count": total,
+                "prices": {"buckets": [dict(bucket, courses={"doc_count": bucket["doc_count"]})
+                                       for bucket in _buckets(["free", "paid"])]},
+            }
+        else:
+            keys = {
+                "offered_by": [offered_by.value for offered_by in OfferedByType],
+                "topics": TOPICS,
+                "type": [resource_type.value for resource_type in ResourceType],
+            }.get(name, [])
+            response["aggregations"][name] = {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": 0,
+                "buckets": _buckets(keys),
+            }
+    return response
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler answering search requests"""
+    protocol_version = "HTTP/1.1"
+    total = 40
+    delay = 0.0
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a search or multi search"""
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/_msearch"):
+            lines = [line for line in body.splitlines() if line.strip()]
+            # odd lines are headers, even lines are queries
+            result = {"took": 1, "responses": [
+                fake_search_response(json.loads(line), self.total) for line in lines[1::2]
+            ]}
+        elif path.endswith("/_search") or path.rstrip("/") == "/api/v0/search":
+            result = fake_search_response(json.loads(body or b"{}"), self.total)
+        else:
+            self.send_error(404)
+            return
+
+        if self.delay:
+            time.sleep(self.delay)
+        payload = dumps(result)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keep the console quiet"""
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server handling each connection in a thread"""
+    daemon_threads = True
+
+
+def main():
+    """Run the stub server"""
+    parser = argparse.ArgumentParser(description="Run a stub search backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--total", type=int, default=40, help="number of hits every search pretends to find")
+    parser.add_argument("--delay-ms", type=float, default=0, help="artificial latency added to every response")
+    args = parser.parse_args()
+
+    StubHandler.total = args.total
+    StubHandler.delay = args.delay_ms / 1000
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print("Stub search backend listening on http://{}:{}".format(args.host, args.port))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
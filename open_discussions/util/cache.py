@@ -0,0 +1,147 @@
+"""In-process caches shared by the load tests"""
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A bounded least-recently-used cache which keeps track of its own hit, miss and eviction counts
+
+    A maxsize of 0 disables caching, every lookup is then counted as a miss. With a ttl, entries
+    expire that many seconds after they were stored, or after they were last used if sliding.
+    on_evict is called with each value evicted or expired, to release what it holds.
+    """
+    def __init__(self, maxsize, ttl=None, sliding=False, on_evict=None):
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sliding = sliding
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # values are stored as (value, expiry time or None)
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data and not self._expired(self._data[key])
+
+    @staticmethod
+    def _expired(entry):
+        """Returns True if a stored (value, expiry time) entry has expired"""
+        return entry[1] is not None and entry[1] <= time.monotonic()
+
+    def _lookup(self, key):
+        """
+        Returns:
+            tuple of (bool, any): whether the key is cached and unexpired, and its value
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        if self._expired(entry):
+            del self._data[key]
+            self.expirations += 1
+            if self.on_evict is not None:
+                self.on_evict(entry[0])
+            return False, None
+        self._data.move_to_end(key)
+        if self.sliding:
+            self._data[key] = (entry[0], time.monotonic() + self.ttl)
+        return True, entry[0]
+
+    def get(self, key, default=None):
+        """
+        Look up a key, marking it as recently used
+
+        Args:
+            key (hashable): the cache key
+            default (any): the value returned on a miss
+
+        Returns:
+            any: the cached value or default
+        """
+        found, value = self._lookup(key)
+        if not found:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def put(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used entry if the cache is full
+
+        Args:
+            key (hashable): the cache key
+            value (any): the value to store
+            ttl (float): seconds until this entry expires, instead of the cache's ttl
+        """
+        if self.maxsize == 0:
+            return
+        if ttl is None:
+            ttl = self.ttl
+        self._data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            _, (evicted, _) = self._data.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+    def get_or_create(self, key, factory):
+        """
+        Look up a key, calling factory() to create and store the value on a miss
+
+        Args:
+            key (hashable): the cache key
+            factory (callable): called with no arguments to build a missing value
+
+        Returns:
+            any: the cached or newly created value
+        """
+        found, value = self._lookup(key)
+        if not found:
+            self.misses += 1
+            value = factory()
+            self.put(key, value)
+            return value
+        self.hits += 1
+        return value
+
+    def pop(self, key, default=None):
+        """Remove a key without counting it as an eviction"""
+        entry = self._data.pop(key, None)
+        if entry is None or self._expired(entry):
+            return default
+        return entry[0]
+
+    def values(self):
+        """
+        Returns:
+            list: the stored values, expired or not, least recently used first
+        """
+        return [entry[0] for entry in self._data.values()]
+
+    def clear(self):
+        """Remove every entry"""
+        self._data.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: the cache counters
+        """
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,172 @@
+"""
+Latency broken down by request dimensions, kept outside of locust's stats table
+
+Locust keeps a full stats entry per distinct request name, so names need to stay low-cardinality.
+The detailed dimensions of a request (e.g. every search facet) are recorded here instead, as one
+compact log-scaled histogram per (dimension, value). Workers ship their histograms to the master
+with every stats report and the merged percentiles are logged when locust quits.
+"""
+import csv
+import logging
+import math
+from array import array
+
+from locust import events
+
+log = logging.getLogger(__name__)
+
+# buckets grow by 10% so percentiles are accurate to within 10%, 160 buckets reach past 10 minutes
+BUCKET_GROWTH = math.log(1.1)
+BUCKET_COUNT = 160
+PERCENTILES = (50, 90, 99)
+
+
+def bucket_for(response_time):
+    """
+    Returns:
+        int: the histogram bucket for a response time in milliseconds
+    """
+    return min(int(math.log1p(max(response_time, 0)) / BUCKET_GROWTH), BUCKET_COUNT - 1)
+
+
+def bucket_value(bucket):
+    """
+    Returns:
+        float: the upper bound in milliseconds of a histogram bucket
+    """
+    return math.expm1((bucket + 1) * BUCKET_GROWTH)
+
+
+def percentile(histogram, count, percent):
+    """
+    Args:
+        histogram (dict): counts by bucket
+        count (int): the total count
+        percent (int): the percentile to compute
+
+    Returns:
+        float: the approximate percentile in milliseconds
+    """
+    if not count:
+        return 0
+    threshold = count * percent / 100.0
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= threshold:
+            return bucket_value(bucket)
+    return 0
+
+
+class DimensionalLatency:
+    """Per (dimension, value) latency histograms for one kind of request"""
+    def __init__(self, name, csv_path=None):
+        self.name = name
+        self.csv_path = csv_path
+        self.histograms = {}
+        self.totals = {}
+        # latest snapshot received from each worker, keyed by client id
+        self.worker_snapshots = {}
+        self.report_key = "dimensions:{}".format(name)
+
+        events.report_to_master += self.on_report_to_master
+        events.slave_report += self.on_slave_report
+        events.quitting += self.on_quitting
+
+    def record(self, dimensions, response_time):
+        """
+        Record a response time under each of its dimensions
+
+        Args:
+            dimensions (iterable of tuple of (str, str)): the (dimension, value) pairs of the request
+            response_time (float): the response time in milliseconds
+        """
+        bucket = bucket_for(response_time)
+        for key in dimensions:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = array("L", bytes(BUCKET_COUNT * array("L").itemsize))
+                self.totals[key] = 0.0
+            histogram[bucket] += 1
+            self.totals[key] += response_time
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: the sparse histograms and total response times, keyed by "dimension=value"
+        """
+        return {
+            "{}={}".format(*key): {
+                "buckets": {bucket: count for bucket, count in enumerate(histogram) if count},
+                "total": self.totals[key],
+            }
+            for key, histogram in self.histograms.items()
+        }
+
+    def merged(self):
+        """
+        Returns:
+            dict: the snapshots of every worker merged together, or the local snapshot
+        """
+        if not self.worker_snapshots:
+            return self.snapshot()
+        merged = {}
+        for snap in self.worker_snapshots.values():
+            for key, data in snap.items():
+                entry = merged.setdefault(key, {"buckets": {}, "total": 0.0})
+                entry["total"] += data["total"]
+                for bucket, count in data["buckets"].items():
+                    bucket = int(bucket)
+                    entry["buckets"][bucket] = entry["buckets"].get(bucket, 0) + count
+        return merged
+
+    def rows(self):
+        """
+        Returns:
+            list of dict: count, average and percentiles per dimension value
+        """
+        rows = []
+        for key, data in sorted(self.merged().items()):
+            count = sum(data["buckets"].values())
+            row = {
+                "dimension": key,
+                "count": count,
+                "avg_ms": round(data["total"] / count) if count else 0,
+            }
+            for percent in PERCENTILES:
+                row["p{}_ms".format(percent)] = round(percentile(data["buckets"], count, percent))
+            rows.append(row)
+        return rows
+
+    def write_csv(self, path):
+        """Write the merged rows to a CSV file"""
+        rows = self.rows()
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.DictWriter(
+                csv_file, ["dimension", "count", "avg_ms"] + ["p{}_ms".format(p) for p in PERCENTILES]
+            )
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def on_report_to_master(self, client_id, data):
+        """Attach the local histograms to the stats report sent to the master"""
+        data[self.report_key] = self.snapshot()
+
+    def on_slave_report(self, client_id, data):
+        """Keep the latest histograms received from a worker"""
+        if self.report_key in data:
+            self.worker_snapshots[client_id] = data[self.report_key]
+
+    def on_quitting(self):
+        """Log the merged latencies on shutdown, and write them out if a CSV path was given"""
+        if self.csv_path:
+            self.write_csv(self.csv_path)
+        for row in self.rows():
+            log.info(
+                "%s %s: count=%s avg=%sms %s",
+                self.name,
+                row["dimension"],
+                row["count"],
+                row["avg_ms"],
+                " ".join("p{}={}ms".format(p, row["p{}_ms".format(p)]) for p in PERCENTILES)
+            )
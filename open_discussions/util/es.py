@@ -1,7 +1,12 @@
 """Elasticsearch utils"""
+import json
+import re
+import time
 from collections import namedtuple
 from enum import Enum
 
+from open_discussions.util.cache import LRUCache
+
 AGGREGATIONS = {
     "availability": {
         "aggs": {
@@ -106,8 +111,21 @@ QueryParams = namedtuple("QueryParams", [
     "text",
     "types",
     "offered_by",
-    "price"
+    "price",
+    "topics",
+    "availability",
 ])
+# topics and availability are only used when refining a search
+QueryParams.__new__.__defaults__ = ((), None)
+
+# the filter for each availability bucket, taken from the date_range aggregation
+AVAILABILITY_RANGES = {
+    date_range["key"]: {
+        "gte" if bound == "from" else "lt": value
+        for bound, value in date_range.items() if bound != "key"
+    }
+    for date_range in AGGREGATIONS["availability"]["aggs"]["runs"]["date_range"]["ranges"]
+}
 
 
 class ResourceType(Enum):
@@ -268,6 +286,28 @@ def generate_type_query(params, resource_type):
             }
         })
 
+    if params.topics:
+        must.append({
+            "bool": {
+                "should": [{
+                    "term": {
+                        "topics": topic
+                    }
+                } for topic in params.topics]
+            }
+        })
+
+    if params.availability and resource_type in RUN_TYPES:
+        must.append({
+            "nested": {
+                "path": "runs",
+                "query": {
+                    "range": {
+                        "runs.best_start_date": AVAILABILITY_RANGES[params.availability]
+                    }
+                }
+            }
+        })
 
     return {
         "bool": {
@@ -281,14 +321,201 @@ def generate_type_query(params, resource_type):
     }
 
 
+def generate_query(params):
+    return {
+        "bool": {
+            "should": [generate_type_query(params, resource_type) for resource_type in params.types]
+        }
+    }
+
+
 def generate_learn_query(params, offset, limit):
     return {
         "aggs": AGGREGATIONS,
-        "query": {
-            "bool": {
-                "should": [generate_type_query(params, resource_type) for resource_type in params.types]
-            }
-        },
+        "query": generate_query(params),
         "from": offset,
         "size": limit,
     }
+
+
+def dumps(value):
+    """Encode a value as compact JSON bytes"""
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+# the aggregations never change, so they are encoded once and spliced into every request body
+AGGREGATIONS_JSON = dumps(AGGREGATIONS)
+AGGREGATION_NAMES = sorted(AGGREGATIONS)
+# "all" sends every aggregation, "none" sends none, otherwise a single aggregation by name
+AGGREGATION_FRAGMENTS = dict(
+    {name: dumps({name: AGGREGATIONS[name]}) for name in AGGREGATION_NAMES},
+    all=AGGREGATIONS_JSON,
+    none=None,
+)
+
+
+def splice_learn_query(query_json, offset, limit, aggs="all"):
+    """
+    Assemble an encoded request body equivalent to generate_learn_query()
+
+    Args:
+        query_json (bytes): the encoded output of generate_query()
+        offset (int): the offset of the first hit
+        limit (int): the number of hits to return
+        aggs (str): which aggregations to include, a key of AGGREGATION_FRAGMENTS
+
+    Returns:
+        bytes: the JSON request body
+    """
+    aggs_json = AGGREGATION_FRAGMENTS[aggs]
+    # joined in one go, the aggregations are most of the body and are only copied once
+    return b"".join((
+        b'{"aggs":' if aggs_json is not None else b"",
+        aggs_json if aggs_json is not None else b"",
+        b',"query":' if aggs_json is not None else b'{"query":',
+        query_json,
+        b',"from":', str(offset).encode("ascii"),
+        b',"size":', str(limit).encode("ascii"),
+        b"}",
+    ))
+
+
+def encode_learn_query(params, offset, limit, aggs="all"):
+    """
+    Generate and encode a learn query
+
+    Args:
+        params (QueryParams): the search parameters
+        offset (int): the offset of the first hit
+        limit (int): the number of hits to return
+        aggs (str): which aggregations to include, a key of AGGREGATION_FRAGMENTS
+
+    Returns:
+        bytes: the JSON request body
+    """
+    return splice_learn_query(dumps(generate_query(params)), offset, limit, aggs=aggs)
+
+
+def params_key(params):
+    """
+    Returns:
+        tuple: a hashable key for the search parameters, the same whatever order the filters were picked in
+    """
+    return (
+        params.text,
+        frozenset(params.types),
+        frozenset(params.offered_by),
+        frozenset(params.price),
+        frozenset(params.topics),
+        params.availability,
+    )
+
+
+class QueryCache:
+    """
+    A bounded cache of encoded learn queries
+
+    A query is encoded once per set of search parameters, then the offset, limit and aggregations
+    of each page are spliced around it. Parameters differing only in the order of their filters
+    share an entry, their queries match the same documents.
+    """
+    def __init__(self, maxsize):
+        self.cache = LRUCache(maxsize)
+
+    def get(self, params, offset, limit, aggs="all"):
+        """
+        Get the encoded request body for a search, encoding its query on a miss
+
+        Args:
+            params (QueryParams): the search parameters
+            offset (int): the offset of the first hit
+            limit (int): the number of hits to return
+            aggs (str): which aggregations to include, a key of AGGREGATION_FRAGMENTS
+
+        Returns:
+            bytes: the JSON request body
+        """
+        query_json = self.cache.get_or_create(params_key(params), lambda: dumps(generate_query(params)))
+        return splice_learn_query(query_json, offset, limit, aggs=aggs)
+
+    def stats(self):
+        """
+        Returns:
+            dict: the cache counters
+        """
+        return self.cache.stats()
+
+
+def aggregation_buckets(results):
+    """
+    Extract the buckets of the learn aggregations from a search response
+
+    Args:
+        results (dict): the decoded search response
+
+    Returns:
+        dict: lists of (key, doc_count) tuples by aggregation name
+    """
+    aggregations = results.get("aggregations") or {}
+    buckets = {}
+    for name in ("offered_by", "topics", "type"):
+        if name in aggregations:
+            buckets[name] = [(bucket["key"], bucket["doc_count"]) for bucket in aggregations[name]["buckets"]]
+    if "availability" in aggregations:
+        # these count runs, the reverse nested courses count is what the facet shows
+        buckets["availability"] = [
+            (bucket["key"], bucket.get("courses", bucket)["doc_count"])
+            for bucket in aggregations["availability"]["runs"]["buckets"]
+        ]
+    return buckets
+
+
+# the hits array comes before the (much larger) aggregations in a search response
+HITS_ARRAY = re.compile(rb'"hits"\s*:\s*\[')
+HITS_DECODER = json.JSONDecoder()
+
+
+def stream_hit_count(chunks):
+    """
+    Count the hits of a search response without decoding the whole response
+
+    Only the hits array is decoded, the remaining chunks are read and counted but not parsed
+    so the connection can be reused.
+
+    Args:
+        chunks (iterable of bytes): the response body
+
+    Returns:
+        tuple of (int, int, float):
+            the number of hits (None if the response has no hits array),
+            the number of bytes read,
+            the seconds spent parsing
+    """
+    buffer = bytearray()
+    bytes_read = 0
+    hits_start = None
+    count = None
+    parse_time = 0.0
+    for chunk in chunks:
+        bytes_read += len(chunk)
+        if count is not None:
+            continue
+
+        start = time.monotonic()
+        buffer += chunk
+        if hits_start is None:
+            # rescan the tail of the previous chunk in case the key was split between chunks
+            match = HITS_ARRAY.search(buffer, max(len(buffer) - len(chunk) - 16, 0))
+            if match is not None:
+                hits_start = match.end() - 1
+        if hits_start is not None:
+            try:
+                hits, _ = HITS_DECODER.raw_decode(buffer[hits_start:].decode("utf-8", "ignore"))
+            except ValueError:
+                # the array continues in a later chunk
+                pass
+            else:
+                count = len(hits)
+                buffer = None
+        parse_time += time.monotonic() - start
+    return count, bytes_read, parse_time
@@ -0,0 +1,184 @@
+"""Bounded random-access registries of the entities the load tests create"""
+import random
+
+
+class _Bucket:
+    """The entities of one kind, in a list for random access and a dict for removal"""
+    __slots__ = ("items", "weights", "positions", "seen", "max_weight")
+
+    def __init__(self):
+        self.items = []
+        self.weights = []
+        # index of each item in items
+        self.positions = {}
+        # items ever added, for reservoir sampling
+        self.seen = 0
+        # an upper bound of the weights, it only grows
+        self.max_weight = 0
+
+
+class EntityRegistry:
+    """
+    Entities by kind, shared by every simulated user of a process
+
+    Adding, removing and picking an entity at random take constant time, removal swapping the
+    last entity of the kind into the removed one's place. A kind holds at most maxsize entities;
+    past that, a newly added entity replaces a random one or is dropped, as reservoir sampling
+    does, so a kind stays a uniform sample of everything added to it over a long run.
+
+    A kind is a string, or a tuple starting with one to scope it, like ("posts", channel_name).
+    Counts are reported per string, summed over its scopes.
+
+    With a scope_kind, a tuple kind is scoped by an entity of that kind, like a channel of
+    "channels". Its entities are dropped when the scope is evicted or removed, and adding to it
+    while the scope is not registered is ignored, so the registry as a whole stays bounded too.
+    """
+    def __init__(self, maxsize, scope_kind=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.scope_kind = scope_kind
+        self._buckets = {}
+        # the tuple kinds of each scope
+        self._scoped = {}
+        self.evictions = {}
+
+    @staticmethod
+    def _name(kind):
+        """
+        Returns:
+            str: the name a kind is reported under
+        """
+        return kind[0] if isinstance(kind, tuple) else kind
+
+    def add(self, kind, item, weight=1):
+        """
+        Add an entity, or update its weight if it is already registered
+
+        Args:
+            kind (str or tuple): the kind of entity
+            item (hashable): the entity, usually its id or name
+            weight (float): how likely a weighted pick returns it, relative to the other entities
+        """
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        bucket = self._buckets.get(kind)
+        if bucket is None:
+            if self.scope_kind is not None and isinstance(kind, tuple):
+                scope = kind[1]
+                if scope not in self._positions(self.scope_kind):
+                    return
+                self._scoped.setdefault(scope, set()).add(kind)
+            bucket = self._buckets[kind] = _Bucket()
+        bucket.max_weight = max(bucket.max_weight, weight)
+
+        position = bucket.positions.get(item)
+        if position is not None:
+            bucket.weights[position] = weight
+            return
+
+        bucket.seen += 1
+        if len(bucket.items) < self.maxsize:
+            bucket.positions[item] = len(bucket.items)
+            bucket.items.append(item)
+            bucket.weights.append(weight)
+            return
+
+        name = self._name(kind)
+        self.evictions[name] = self.evictions.get(name, 0) + 1
+        position = random.randrange(bucket.seen)
+        if position >= self.maxsize:
+            # the new entity is the one left out of the sample
+            return
+        evicted = bucket.items[position]
+        del bucket.positions[evicted]
+        bucket.positions[item] = position
+        bucket.items[position] = item
+        bucket.weights[position] = weight
+        if kind == self.scope_kind:
+            self._drop_scope(evicted)
+
+    def remove(self, kind, item):
+        """
+        Args:
+            kind (str or tuple): the kind of entity
+            item (hashable): the entity
+
+        Returns:
+            bool: True if the entity was registered
+        """
+        bucket = self._buckets.get(kind)
+        if bucket is None or item not in bucket.positions:
+            return False
+        position = bucket.positions.pop(item)
+        last_item = bucket.items.pop()
+        last_weight = bucket.weights.pop()
+        if position < len(bucket.items):
+            bucket.items[position] = last_item
+            bucket.weights[position] = last_weight
+            bucket.positions[last_item] = position
+        if kind == self.scope_kind:
+            self._drop_scope(item)
+        return True
+
+    def _positions(self, kind):
+        """
+        Returns:
+            dict: the index of each entity of the kind
+        """
+        bucket = self._buckets.get(kind)
+        return bucket.positions if bucket is not None else {}
+
+    def _drop_scope(self, scope):
+        """Drop the tuple kinds scoped by an entity"""
+        for kind in self._scoped.pop(scope, ()):
+            del self._buckets[kind]
+
+    def pick(self, kind, weighted=False):
+        """
+        Pick an entity at random
+
+        Weighted picks draw uniformly and accept in proportion to the weight, which takes
+        constant time on average while the weights of a kind are of the same order.
+
+        Args:
+            kind (str or tuple): the kind of entity
+            weighted (bool): pick in proportion to the weights instead of uniformly
+
+        Returns:
+            hashable: the entity
+
+        Raises:
+            IndexError: if there is no entity of the kind, like random.choice
+        """
+        bucket = self._buckets.get(kind)
+        if bucket is None or not bucket.items:
+            raise IndexError("No {} registered".format(kind))
+        count = len(bucket.items)
+        if not weighted:
+            return bucket.items[random.randrange(count)]
+        while True:
+            position = random.randrange(count)
+            if random.random() * bucket.max_weight < bucket.weights[position]:
+                return bucket.items[position]
+
+    def count(self, kind):
+        """
+        Returns:
+            int: the number of entities of the kind
+        """
+        bucket = self._buckets.get(kind)
+        return len(bucket.items) if bucket is not None else 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: the number of entities and of evictions per kind name
+        """
+        stats = {}
+        for kind, bucket in self._buckets.items():
+            name = self._name(kind)
+            stats[name] = stats.get(name, 0) + len(bucket.items)
+        for name, evictions in self.evictions.items():
+            stats[name + ".evictions"] = evictions
+        return stats
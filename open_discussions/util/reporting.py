@@ -0,0 +1,92 @@
+"""
+Client-side counters reported alongside the locust stats
+
+Modules register a callable returning a dict of numeric counters. Workers ship a snapshot of
+them to the master with every stats report, and the totals are logged when locust quits.
+"""
+import logging
+
+from locust import events
+
+log = logging.getLogger(__name__)
+
+SOURCES = {}
+# latest snapshot received from each worker, keyed by client id
+WORKER_SNAPSHOTS = {}
+
+REPORT_KEY = "client_counters"
+
+
+def register(name, source):
+    """
+    Register a source of counters
+
+    Args:
+        name (str): the name the counters are reported under
+        source (callable): returns a dict of counter name to number
+    """
+    SOURCES[name] = source
+
+
+def snapshot():
+    """
+    Returns:
+        dict: the current counters of every registered source, keyed by source name
+    """
+    return {name: source() for name, source in SOURCES.items()}
+
+
+def merge(snapshots):
+    """
+    Sum the numeric counters of several snapshots
+
+    Args:
+        snapshots (iterable of dict): snapshots as returned by snapshot()
+
+    Returns:
+        dict: the summed counters, keyed by source name
+    """
+    merged = {}
+    for snap in snapshots:
+        for name, counters in snap.items():
+            totals = merged.setdefault(name, {})
+            for key, value in counters.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+    return merged
+
+
+def totals():
+    """
+    Returns:
+        dict: the counters across all workers on a master, otherwise the local counters
+    """
+    if WORKER_SNAPSHOTS:
+        return merge(WORKER_SNAPSHOTS.values())
+    return snapshot()
+
+
+def on_report_to_master(client_id, data):
+    """Attach the local counters to the stats report sent to the master"""
+    data[REPORT_KEY] = snapshot()
+
+
+def on_slave_report(client_id, data):
+    """Keep the latest counters received from a worker"""
+    if REPORT_KEY in data:
+        WORKER_SNAPSHOTS[client_id] = data[REPORT_KEY]
+
+
+def on_quitting():
+    """Log the counters on shutdown"""
+    for name, counters in sorted(totals().items()):
+        log.info(
+            "%s: %s",
+            name,
+            ", ".join("{}={}".format(key, value) for key, value in sorted(counters.items()))
+        )
+
+
+events.report_to_master += on_report_to_master
+events.slave_report += on_slave_report
+events.quitting += on_quitting